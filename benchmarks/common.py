@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+#
+# Helpers shared by the benchmarks
+#
+# The benchmarks use the modules in scripts/ the same way the container runs
+# them from /app, so the scripts folder is put on the module search path.
+
+import os
+import sys
+import json
+import resource
+
+scripts_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                              '..', 'scripts')
+if scripts_folder not in sys.path:
+    sys.path.insert(0, scripts_folder)
+
+import inbox
+
+default_fixtures = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'fixtures')
+
+# whisper resamples all audio to 16 kHz
+sample_rate = 16000
+
+
+def find_fixtures(folder):
+    """
+        Lists the audio fixtures of the folder as (path, reference) pairs.
+        The reference transcript is read from a .txt file with the same
+        name as the audio file, it is None when there is no such file.
+    """
+    fixtures = []
+    for filename in sorted(os.listdir(folder)):
+        if not inbox.is_supported(filename):
+            continue
+        path = os.path.join(folder, filename)
+        reference = os.path.splitext(path)[0] + ".txt"
+        if os.path.isfile(reference):
+            with open(reference) as f:
+                reference = f.read().strip()
+        else:
+            reference = None
+        fixtures.append((path, reference))
+    return fixtures
+
+
+def percentile(values, pct):
+    """ Nearest-rank percentile, 0.0 for an empty list. """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def peak_rss_mb():
+    """ Peak resident set size of this process in MiB (Linux reports KiB). """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def write_results(results, output):
+    """ Writes the results as JSON to the file, or stdout when output is - """
+    if output == "-":
+        print(json.dumps(results, indent = 4))
+        return
+    with open(output, "w") as f:
+        json.dump(results, f, indent = 4)
+    print(f"Results written to {output}")
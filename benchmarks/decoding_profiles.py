@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+#
+# Benchmark of the decoding profiles
+#
+# Transcribes the audio fixtures with every decoding profile and reports the
+# real-time factor (processing time / audio duration, below 1 is faster than
+# real time) and the word error rate against the reference transcripts.
+#
+#   python3 benchmarks/decoding_profiles.py -m small -t /targets.json
+
+import argparse
+import sys
+import time
+
+import common
+import profiles
+import routing
+from wer import word_errors
+
+
+def load_profiles(targets):
+    """ Profiles of targets.json, or only the built in ones. """
+    if targets is None:
+        return profiles.compile_profiles({})
+    return routing.TargetsFile(targets).load().profiles
+
+
+def benchmark_profile(model, name, options, fixtures):
+    """ Transcribes the preloaded fixtures with the profile options. """
+    files = []
+    for path, audio, reference in fixtures:
+        start = time.perf_counter()
+        result = model.transcribe(audio, **options)
+        elapsed = time.perf_counter() - start
+        duration = len(audio) / common.sample_rate
+        record = {"file": path, "seconds": round(elapsed, 3),
+                  "audio_seconds": round(duration, 3),
+                  "rtf": round(elapsed / duration, 4) if duration else None}
+        if reference is not None:
+            errors, words = word_errors(reference, result["text"])
+            record.update({"errors": errors, "words": words})
+        files.append(record)
+        print(f"  {name}: {path} {record['seconds']} s")
+
+    seconds = sum(record["seconds"] for record in files)
+    audio_seconds = sum(record["audio_seconds"] for record in files)
+    words = sum(record.get("words", 0) for record in files)
+    errors = sum(record.get("errors", 0) for record in files)
+    return {
+        "profile": name,
+        "options": options,
+        "seconds": round(seconds, 3),
+        "audio_seconds": round(audio_seconds, 3),
+        "rtf": round(seconds / audio_seconds, 4) if audio_seconds else None,
+        "wer": round(errors / words, 4) if words else None,
+        "files": files,
+    }
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = 'Benchmark the decoding \
+                                     profiles: real-time factor and WER')
+    parser.add_argument('-m', '--model', default = "medium",
+                        help = 'Whisper AI model size')
+    parser.add_argument('-t', '--targets', default = None,
+                        help = 'targets.json with profile definitions')
+    parser.add_argument('-p', '--profile', action = 'append',
+                        help = 'Profile to benchmark, repeatable \
+                        (default: all)')
+    parser.add_argument('--fixtures', default = common.default_fixtures,
+                        help = 'Folder of audio files and .txt references')
+    parser.add_argument('--model-location', default = "/var/models")
+    parser.add_argument('-o', '--output', default = None,
+                        help = 'Write the results as JSON to this file')
+    args = parser.parse_args(arguments[1:])
+
+    try:
+        compiled = load_profiles(args.targets)
+    except routing.ConfigError as e:
+        print(e)
+        return 1
+    names = args.profile or sorted(compiled)
+    unknown = [name for name in names if name not in compiled]
+    if unknown:
+        print(f"Unknown profiles: {', '.join(unknown)}")
+        return 1
+
+    fixtures = common.find_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No audio fixtures in {args.fixtures}")
+        return 1
+
+    import whisper
+    model = whisper.load_model(args.model, download_root = args.model_location)
+    # decode the audio once, only the inference is timed
+    fixtures = [(path, whisper.load_audio(path), reference)
+                for path, reference in fixtures]
+
+    results = []
+    for name in names:
+        options = dict(compiled[name])
+        if model.device.type == "cpu":
+            options.setdefault("fp16", False)
+        results.append(benchmark_profile(model, name, options, fixtures))
+
+    print(f"\n{'profile':<16} {'RTF':>8} {'WER':>8}")
+    for result in results:
+        rtf = "-" if result["rtf"] is None else f"{result['rtf']:.3f}"
+        wer = "-" if result["wer"] is None else f"{result['wer']:.3f}"
+        print(f"{result['profile']:<16} {rtf:>8} {wer:>8}")
+
+    if args.output:
+        common.write_results({"model": args.model, "profiles": results},
+                             args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#
+# Deterministic stand-in for the whisper module
+#
+# The "audio" files are text files, the transcript is the content of the file.
+# Inference time is simulated with a fixed latency plus a real-time factor
+# of the configured audio duration. Install it before the model is loaded:
+#
+#   import sys, fake_whisper
+#   fake_whisper.configure(latency = 0.05)
+#   sys.modules['whisper'] = fake_whisper
+
+import time
+
+sample_rate = 16000
+
+settings = {
+    # seconds added to every transcribe() call
+    "latency": 0.0,
+    # seconds of processing per second of audio
+    "rtf": 0.0,
+    # audio duration reported for every file
+    "duration": 10.0,
+}
+
+
+def configure(**options):
+    """ Changes the simulated latency, real-time factor or duration. """
+    for key, value in options.items():
+        if key not in settings:
+            raise ValueError(f"unknown fake whisper setting {key}")
+        settings[key] = value
+
+
+class FakeAudio:
+    """ Decoded "audio": the scripted text and a duration. """
+
+    def __init__(self, text, duration):
+        self.text = text
+        self.duration = duration
+
+    def __len__(self):
+        return int(self.duration * sample_rate)
+
+
+def load_audio(file, sr = sample_rate):
+    with open(file, encoding = "utf-8") as f:
+        return FakeAudio(f.read().strip(), settings["duration"])
+
+
+class FakeModel:
+    """ Answers transcribe() with the scripted text of the file. """
+
+    class device:
+        type = "cpu"
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+
+    def transcribe(self, audio, **options):
+        if not isinstance(audio, FakeAudio):
+            audio = load_audio(audio)
+        self.calls += 1
+        time.sleep(settings["latency"] + settings["rtf"] * audio.duration)
+        text = " " + audio.text
+        return {
+            "text": text,
+            "language": options.get("language") or "en",
+            "segments": [{"seek": 0, "start": 0.0, "end": audio.duration,
+                          "text": text, "temperature": 0.0}],
+        }
+
+
+def load_model(name, device = None, download_root = None, in_memory = False):
+    return FakeModel(name)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+#
+# Local SMTP server which accepts every message and keeps it in memory
+#
+# Enough of the protocol for smtplib.SMTP().sendmail(), used by the stress
+# harness instead of a real mail server.
+
+import email
+import socketserver
+import threading
+
+
+class SMTPHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        self.reply("220 smtp-sink ready")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode(errors = "replace").strip()
+            verb = command[:4].upper()
+            if verb in ("HELO", "EHLO"):
+                self.reply("250 smtp-sink")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip(" <>"), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                recipients.append(command[8:].strip(" <>"))
+                self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    line = self.rfile.readline()
+                    if not line or line in (b".\r\n", b".\n"):
+                        break
+                    # undo the dot-stuffing of the client
+                    lines.append(line[1:] if line.startswith(b"..") else line)
+                self.server.sink.store(sender, recipients, b"".join(lines))
+                self.reply("250 OK")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class SMTPSink:
+    """
+        SMTP server on localhost, messages holds (sender, recipients,
+        email.message.Message) tuples of the received messages.
+    """
+
+    def __init__(self, host = "127.0.0.1", port = 0):
+        self.messages = []
+        self.lock = threading.Lock()
+        self.server = SMTPServer((host, port), SMTPHandler)
+        self.server.sink = self
+        self.host, self.port = self.server.server_address
+        self.thread = None
+
+    def store(self, sender, recipients, data):
+        message = email.message_from_bytes(data)
+        with self.lock:
+            self.messages.append((sender, recipients, message))
+
+    def start(self):
+        self.thread = threading.Thread(target = self.server.serve_forever,
+                                       daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+#
+# Stress harness for the transcription pipeline
+#
+# Runs the real folder handling, routing, file moves and email sending with a
+# fake whisper model (fake_whisper.py) and a local SMTP sink (smtp_sink.py),
+# so the overhead of the pipeline itself can be measured without paying for
+# inference. Thousands of scripted files are generated into a temporary
+# /audio folder, every one of them starts with one of the magic words of
+# targets.json. Reports files/sec, per-stage latency and whether every file
+# ended up where its target says.
+#
+#   python3 benchmarks/stress.py -n 2000 --latency 0.001 -t /targets.json
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import common
+import fake_whisper
+import inbox
+import routing
+import scheduler
+import LLM_text_to_speech as stt
+from smtp_sink import SMTPSink
+
+sample_targets = {
+    "default": {"keepaudiofile": False, "transcript": "inbox"},
+    "kauppa": {"keepaudiofile": False, "transcript": "notes",
+               "filename": "kauppa.md", "aliases": ["shopping list"]},
+    "muistio": {"keepaudiofile": "audio", "transcript": "notes",
+                "filename": "muistio.md", "timestamp": True},
+    "todo later": {"keepaudiofile": False, "transcript": "notes",
+                   "filename": "later.md"},
+    "viesti": {"keepaudiofile": True, "email": "viesti@example.com",
+               "transcript": "subject"},
+    "posti": {"keepaudiofile": False, "email": "posti@example.com",
+              "transcript": "body"},
+}
+
+
+def spoken_forms(config):
+    """
+        (target, phrase) pairs of every magic word and alias, plus texts
+        without a magic word for the default target.
+    """
+    forms = [("default", "nothing special")]
+    for name, details in config.items():
+        if name == "default" or name in routing.reserved_keys:
+            continue
+        for phrase in [name] + details.get("aliases", []):
+            forms.append((name, phrase))
+            forms.append((name, phrase.capitalize() + ","))
+    return forms
+
+
+def generate_files(folder, config, count, seed):
+    """ Writes the scripted "audio" files, returns the expected routes. """
+    rng = random.Random(seed)
+    forms = spoken_forms(config)
+    extensions = [".wav", ".mp3", ".m4a"]
+    expected = []
+    for number in range(count):
+        target, phrase = forms[number % len(forms)] if number < len(forms) \
+            else rng.choice(forms)
+        filename = f"stress_{number:06d}{rng.choice(extensions)}"
+        text = f"{phrase} stress note {number} {rng.getrandbits(32):08x}"
+        with open(os.path.join(folder, filename), "w") as f:
+            f.write(text)
+        expected.append({"filename": filename, "text": text,
+                         "target": target})
+    return expected
+
+
+def prepare_target_folders(target_root, config):
+    for name, details in config.items():
+        if name in routing.reserved_keys:
+            continue
+        if 'email' not in details:
+            os.makedirs(os.path.join(target_root, details['transcript']),
+                        exist_ok = True)
+        if isinstance(details.get('keepaudiofile'), str):
+            os.makedirs(os.path.join(target_root, details['keepaudiofile']),
+                        exist_ok = True)
+
+
+def verify(expected, config, audio, target_root, sink, email_enabled):
+    """
+        Checks that every file was handled the way its target says. Returns
+        target -> {"ok": n, "failed": n} and a list of failure descriptions.
+    """
+    routes = {}
+    failures = []
+    transcripts = {}
+    mails = {}
+    for sender, recipients, message in sink.messages if sink else []:
+        body = message.get_payload()[0].get_payload()
+        mails.setdefault(recipients[0], []).append(
+            (message["Subject"], body, len(message.get_payload()) > 1))
+
+    def read(path):
+        if path not in transcripts:
+            try:
+                with open(path) as f:
+                    transcripts[path] = f.read()
+            except FileNotFoundError:
+                transcripts[path] = ""
+        return transcripts[path]
+
+    for item in expected:
+        target = item["target"]
+        details = config[target]
+        problems = []
+        if os.path.exists(os.path.join(audio, item["filename"])):
+            problems.append("audio file left in the input folder")
+
+        if 'email' in details and not email_enabled:
+            # without a mail server the note is handled as default
+            target, details = "default", config["default"]
+
+        if 'email' in details:
+            received = mails.get(details['email'], [])
+            field = 0 if details['transcript'] == 'subject' else 1
+            match = [mail for mail in received if item["text"] in mail[field]]
+            if not match:
+                problems.append(f"no email to {details['email']}")
+            elif bool(details['keepaudiofile']) != match[0][2]:
+                problems.append("attachment does not match keepaudiofile")
+        else:
+            filename = details.get('filename', item["filename"] + ".md")
+            path = os.path.join(target_root, details['transcript'], filename)
+            if item["text"] not in read(path):
+                problems.append(f"text missing from {path}")
+            if isinstance(details.get('keepaudiofile'), str):
+                kept = os.path.join(target_root, details['keepaudiofile'],
+                                    item["filename"])
+                if not os.path.isfile(kept):
+                    problems.append(f"audio file not kept in {kept}")
+
+        counts = routes.setdefault(item["target"], {"ok": 0, "failed": 0})
+        if problems:
+            counts["failed"] += 1
+            failures.append(f"{item['filename']} ({item['target']}): "
+                            + ", ".join(problems))
+        else:
+            counts["ok"] += 1
+    return routes, failures
+
+
+def timed(stage, function, timings):
+    """ Wraps the function, the call durations are appended to timings. """
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        finally:
+            timings[stage].append(time.perf_counter() - start)
+    return wrapper
+
+
+def stage_summary(values):
+    return {
+        "count": len(values),
+        "mean_ms": round(1000 * sum(values) / len(values), 3) if values else 0,
+        "p50_ms": round(1000 * common.percentile(values, 50), 3),
+        "p95_ms": round(1000 * common.percentile(values, 95), 3),
+        "max_ms": round(1000 * max(values), 3) if values else 0,
+    }
+
+
+def run_stress(config, files, workdir, latency = 0.0, rtf = 0.0,
+               email = True, seed = 0, verbose = False):
+    """ Runs the pipeline over generated files, returns the results. """
+    audio = os.path.join(workdir, "audio")
+    target_root = os.path.join(workdir, "target")
+    os.makedirs(audio)
+    prepare_target_folders(target_root, config)
+    targets_file = os.path.join(workdir, "targets.json")
+    with open(targets_file, "w") as f:
+        json.dump(config, f)
+
+    sink = None
+    email_file = os.path.join(workdir, "email.json")
+    if email:
+        sink = SMTPSink().start()
+        with open(email_file, "w") as f:
+            json.dump({"smtp_server": sink.host, "smtp_port": sink.port,
+                       "sender_email": "stress@example.com"}, f)
+
+    expected = generate_files(audio, config, files, seed)
+    timings = {"discovery": [], "transcribe": [], "handle_output": [],
+               "file": []}
+
+    fake_whisper.configure(latency = latency, rtf = rtf)
+    saved_whisper = sys.modules.get("whisper")
+    sys.modules["whisper"] = fake_whisper
+    output = contextlib.nullcontext() if verbose \
+        else contextlib.redirect_stdout(io.StringIO())
+    try:
+        with output:
+            AI = stt.transciber("fake")
+            AI.targets_file = targets_file
+            AI.email_file = email_file
+            AI.target_location = target_root
+            AI.load_config()
+            AI.transcribe = timed("transcribe", AI.transcribe, timings)
+            AI.handle_output = timed("handle_output", AI.handle_output,
+                                     timings)
+
+            # the generated files are complete, no need to wait for them
+            source = inbox.Source(audio, "default", None, 1.0)
+            queue = scheduler.FairShare([scheduler.Share(
+                source, inbox.Inbox(audio, settle_seconds = 0))])
+            start = time.perf_counter()
+            while True:
+                file_start = time.perf_counter()
+                if stt.process_next(AI, queue) is None:
+                    break
+                elapsed = time.perf_counter() - file_start
+                timings["file"].append(elapsed)
+                timings["discovery"].append(
+                    elapsed - timings["transcribe"][-1]
+                    - timings["handle_output"][-1])
+            total = time.perf_counter() - start
+    finally:
+        if saved_whisper is None:
+            sys.modules.pop("whisper", None)
+        else:
+            sys.modules["whisper"] = saved_whisper
+        if sink:
+            sink.stop()
+
+    routes, failures = verify(expected, config, audio, target_root, sink,
+                              email)
+    return {
+        "files": len(timings["file"]),
+        "seconds": round(total, 3),
+        "files_per_second": round(len(timings["file"]) / total, 2)
+                            if total else None,
+        "fake_latency": latency,
+        "stages": {stage: stage_summary(values)
+                   for stage, values in timings.items()},
+        "routes": routes,
+        "failures": failures,
+    }
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = 'Stress the pipeline with \
+                                     a fake whisper model and SMTP sink')
+    parser.add_argument('-n', '--files', type = int, default = 1000,
+                        help = 'Number of files to generate')
+    parser.add_argument('-t', '--targets', default = None,
+                        help = 'targets.json to test (default: a sample)')
+    parser.add_argument('--latency', type = float, default = 0.0,
+                        help = 'Fake inference seconds per file')
+    parser.add_argument('--rtf', type = float, default = 0.0,
+                        help = 'Fake inference seconds per audio second')
+    parser.add_argument('--no-email', default = False, action = 'store_true',
+                        help = 'Run without the SMTP sink')
+    parser.add_argument('--seed', type = int, default = 0)
+    parser.add_argument('--keep', default = False, action = 'store_true',
+                        help = 'Keep the temporary folders')
+    parser.add_argument('-v', '--verbose', default = False,
+                        action = 'store_true', help = 'Show pipeline output')
+    parser.add_argument('-o', '--output', default = None,
+                        help = 'Write the results as JSON to this file')
+    args = parser.parse_args(arguments[1:])
+
+    if args.targets:
+        try:
+            config = routing.TargetsFile(args.targets).load().config
+        except routing.ConfigError as e:
+            print(e)
+            return 1
+    else:
+        config = sample_targets
+
+    workdir = tempfile.mkdtemp(prefix = "stt-stress-")
+    try:
+        results = run_stress(config, args.files, workdir, args.latency,
+                             args.rtf, not args.no_email, args.seed,
+                             args.verbose)
+    finally:
+        if args.keep:
+            print(f"Files kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors = True)
+
+    print(f"{results['files']} files in {results['seconds']} s, "
+          + f"{results['files_per_second']} files/s")
+    print(f"\n{'stage':<14} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} "
+          + f"{'max ms':>9}")
+    for stage, summary in results["stages"].items():
+        print(f"{stage:<14} {summary['mean_ms']:>9} {summary['p50_ms']:>9} "
+              + f"{summary['p95_ms']:>9} {summary['max_ms']:>9}")
+    print(f"\n{'target':<20} {'ok':>6} {'failed':>6}")
+    for target, counts in sorted(results["routes"].items()):
+        print(f"{target:<20} {counts['ok']:>6} {counts['failed']:>6}")
+    for failure in results["failures"][:20]:
+        print(f"FAILED: {failure}")
+
+    if args.output:
+        common.write_results(results, args.output)
+    return 1 if results["failures"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+#
+# torch thread count sweep
+#
+# Transcribes the audio fixtures with one model and decoding profile using a
+# range of torch thread counts, every count in its own process (the inter-op
+# pool can be sized only once per process). Shows whether the thread count
+# the service picks from the CPU quota and topology (see scripts/cpu.py) is
+# the fastest one on this host. With --parallel several worker processes run
+# at the same time, the way workers with different models share the CPUs.
+#
+#   python3 benchmarks/threads.py -m small
+#   python3 benchmarks/threads.py -m small -t 2 -t 3 -t 4 --parallel 2
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import common
+import cpu
+import profiles
+import throughput
+
+
+def sweep_counts(topology, parallel = 1):
+    """
+        Powers of two up to the CPU count, the default threads of each of
+        the parallel inferences and the CPU count itself (every hyperthread
+        busy).
+    """
+    counts = {cpu.threads_per_inference(topology, parallel),
+              len(topology.cpus)}
+    count = 1
+    while count < len(topology.cpus):
+        counts.add(count)
+        count *= 2
+    return sorted(counts)
+
+
+def run_parallel(job, parallel):
+    """
+        Runs the job in parallel worker processes at the same time, the
+        result has the mean RTF and p50 and the worst p95 of them. None if
+        a worker failed.
+    """
+    workers = [subprocess.Popen([sys.executable,
+                                 os.path.abspath(throughput.__file__),
+                                 "worker"], stdin = subprocess.PIPE,
+                                stdout = subprocess.PIPE,
+                                stderr = subprocess.PIPE, text = True)
+               for _ in range(parallel)]
+    for worker in workers:
+        worker.stdin.write(json.dumps(job))
+        worker.stdin.close()
+    results = []
+    for worker in workers:
+        output, errors = worker.stdout.read(), worker.stderr.read()
+        if worker.wait() != 0:
+            print(errors)
+            return None
+        results.append(json.loads(output.strip().splitlines()[-1]))
+    return dict(results[0], parallel = parallel,
+                rtf = round(sum(r["rtf"] for r in results) / parallel, 4),
+                p50_seconds = round(sum(r["p50_seconds"] for r in results)
+                                    / parallel, 3),
+                p95_seconds = max(r["p95_seconds"] for r in results),
+                peak_rss_mb = sum(r["peak_rss_mb"] for r in results))
+
+
+def format_table(runs, default):
+    """ One line per thread count, the default and the fastest marked. """
+    best = min(runs, key = lambda run: run["rtf"] or float("inf"))
+    lines = [f"{'threads':>8} {'RTF':>8} {'p50 s':>8} {'p95 s':>8}"]
+    for run in runs:
+        marks = []
+        if run["threads"] == default:
+            marks.append("default")
+        if run is best:
+            marks.append("fastest")
+        lines.append(f"{run['threads']:>8} {run['rtf']:>8} "
+                     + f"{run['p50_seconds']:>8} {run['p95_seconds']:>8}  "
+                     + ", ".join(marks))
+    return lines
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = 'torch thread count sweep')
+    parser.add_argument('-m', '--model', default = "medium",
+                        help = 'Model size (default: medium)')
+    parser.add_argument('-p', '--profile', default = "default",
+                        choices = sorted(profiles.builtin_profiles),
+                        help = 'Decoding profile (default: default)')
+    parser.add_argument('-t', '--threads', type = int, action = 'append',
+                        help = 'Thread count, repeatable (default: powers \
+                        of two up to the CPU count and the default)')
+    parser.add_argument('--parallel', type = int, default = 1,
+                        help = 'Worker processes running at the same time \
+                        (default: 1)')
+    parser.add_argument('--fixtures', default = common.default_fixtures,
+                        help = 'Folder of audio fixtures')
+    parser.add_argument('--model-location', default = "/var/models")
+    parser.add_argument('--warmup', type = int, default = 1,
+                        help = 'Untimed files transcribed first')
+    parser.add_argument('-o', '--output', default = None,
+                        help = 'Result file (default: \
+                        threads-<timestamp>.json)')
+    args = parser.parse_args(arguments[1:])
+
+    fixtures = [path for path, _ in common.find_fixtures(args.fixtures)]
+    if not fixtures:
+        print(f"No audio fixtures in {args.fixtures}")
+        return 1
+    topology = cpu.detect()
+    default = cpu.threads_per_inference(topology, args.parallel)
+    print(f"CPU: {cpu.describe(topology)}, default {default} threads per "
+          + "inference")
+
+    runs = []
+    for threads in args.threads or sweep_counts(topology, args.parallel):
+        print(f"Benchmarking {threads} threads")
+        job = {"model": args.model, "profile": args.profile,
+               "options": profiles.compile_profiles({})[args.profile],
+               "fixtures": fixtures, "model_location": args.model_location,
+               "warmup": args.warmup, "threads": threads}
+        result = throughput.run_worker(job) if args.parallel == 1 \
+            else run_parallel(job, args.parallel)
+        if result is None:
+            print(f"{threads} threads failed")
+            return 1
+        runs.append(result)
+
+    print()
+    for line in format_table(runs, default):
+        print(line)
+    results = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": throughput.environment(),
+        "topology": topology._asdict(),
+        "default_threads": default,
+        "fixtures": fixtures,
+        "runs": runs,
+    }
+    common.write_results(results, args.output or
+                         time.strftime("threads-%Y%m%d-%H%M%S.json"))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
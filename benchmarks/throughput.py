@@ -0,0 +1,241 @@
+#!/usr/bin/env python3
+#
+# Model throughput benchmark
+#
+# Runs the audio fixtures through every model size and decoding profile on
+# CPU and records the model load time, real-time factor, p50/p95 latency per
+# file and the peak memory use. Every model / profile pair runs in its own
+# process so the load time and peak RSS of one don't leak into the next.
+# Results are written as JSON, two result files can be compared to catch
+# regressions between versions.
+#
+#   python3 benchmarks/throughput.py run -m tiny -m small -p default -p fast
+#   python3 benchmarks/throughput.py compare old.json new.json
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+import common
+import cpu
+import profiles
+import routing
+
+
+def measure(model_size, profile, options, fixtures, model_location, warmup,
+            threads = None):
+    """
+        Loads the model and transcribes the fixtures, runs inside the worker
+        process. Latency is measured per file from the audio file to the
+        text, the way the service transcribes. threads sets the torch
+        threads, None leaves the torch default.
+    """
+    if threads:
+        cpu.set_torch_threads(threads)
+    import torch
+    import whisper
+
+    start = time.perf_counter()
+    model = whisper.load_model(model_size, device = "cpu",
+                               download_root = model_location)
+    load_seconds = time.perf_counter() - start
+    options = {"fp16": False, **options}
+
+    for path in fixtures[:warmup]:
+        model.transcribe(path, **options)
+
+    latencies = []
+    audio_seconds = 0.0
+    for path in fixtures:
+        audio_seconds += len(whisper.load_audio(path)) / common.sample_rate
+        start = time.perf_counter()
+        model.transcribe(path, **options)
+        latencies.append(time.perf_counter() - start)
+
+    seconds = sum(latencies)
+    return {
+        "model": model_size,
+        "profile": profile,
+        "options": options,
+        "threads": torch.get_num_threads(),
+        "load_seconds": round(load_seconds, 3),
+        "files": len(fixtures),
+        "audio_seconds": round(audio_seconds, 3),
+        "seconds": round(seconds, 3),
+        "rtf": round(seconds / audio_seconds, 4) if audio_seconds else None,
+        "p50_seconds": round(common.percentile(latencies, 50), 3),
+        "p95_seconds": round(common.percentile(latencies, 95), 3),
+        "peak_rss_mb": round(common.peak_rss_mb(), 1),
+    }
+
+
+def environment():
+    """ Versions and hardware the results were measured with. """
+    info = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "cpu_count": os.cpu_count(),
+    }
+    for module in ("whisper", "torch"):
+        try:
+            info[module] = __import__(module).__version__
+        except ImportError:
+            info[module] = None
+    if info["torch"]:
+        import torch
+        info["torch_threads"] = torch.get_num_threads()
+    return info
+
+
+def run_worker(job):
+    """
+        Measures the job in a process of its own, returns the result, None
+        if the worker failed.
+    """
+    worker = subprocess.run([sys.executable, os.path.abspath(__file__),
+                             "worker"], input = json.dumps(job),
+                            capture_output = True, text = True)
+    if worker.returncode != 0:
+        print(worker.stderr)
+        return None
+    return json.loads(worker.stdout.strip().splitlines()[-1])
+
+
+def run(args):
+    try:
+        compiled = routing.TargetsFile(args.targets).load().profiles \
+            if args.targets else profiles.compile_profiles({})
+    except routing.ConfigError as e:
+        print(e)
+        return 1
+    names = args.profile or ["default"]
+    unknown = [name for name in names if name not in compiled]
+    if unknown:
+        print(f"Unknown profiles: {', '.join(unknown)}")
+        return 1
+    fixtures = [path for path, _ in common.find_fixtures(args.fixtures)]
+    if not fixtures:
+        print(f"No audio fixtures in {args.fixtures}")
+        return 1
+
+    runs = []
+    for model_size in args.model or ["medium"]:
+        for name in names:
+            print(f"Benchmarking model {model_size} with profile {name}")
+            job = {"model": model_size, "profile": name,
+                   "options": compiled[name], "fixtures": fixtures,
+                   "model_location": args.model_location,
+                   "warmup": args.warmup}
+            result = run_worker(job)
+            if result is None:
+                print(f"Model {model_size} with profile {name} failed")
+                return 1
+            print(f"  load {result['load_seconds']} s, RTF {result['rtf']}, "
+                  + f"p50 {result['p50_seconds']} s, "
+                  + f"p95 {result['p95_seconds']} s, "
+                  + f"peak RSS {result['peak_rss_mb']} MiB")
+            runs.append(result)
+
+    results = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "environment": environment(),
+        "fixtures": fixtures,
+        "runs": runs,
+    }
+    common.write_results(results, args.output or
+                         time.strftime("throughput-%Y%m%d-%H%M%S.json"))
+    return 0
+
+
+def worker(args):
+    """ Measures one model / profile pair, the job comes in stdin. """
+    job = json.load(sys.stdin)
+    result = measure(job["model"], job["profile"], job["options"],
+                     job["fixtures"], job["model_location"], job["warmup"],
+                     job.get("threads"))
+    print(json.dumps(result))
+    return 0
+
+
+def compare(args):
+    """
+        Compares two result files run by run. A run is a regression when
+        its RTF, p95 latency, load time or peak RSS grew more than the
+        threshold.
+    """
+    with open(args.old) as f:
+        old = {(run["model"], run["profile"]): run for run in json.load(f)["runs"]}
+    with open(args.new) as f:
+        new = {(run["model"], run["profile"]): run for run in json.load(f)["runs"]}
+
+    fields = ["rtf", "p95_seconds", "load_seconds", "peak_rss_mb"]
+    regressions = 0
+    print(f"{'model':<10} {'profile':<12} " + " ".join(f"{field:>16}"
+                                                       for field in fields))
+    for key in sorted(old.keys() & new.keys()):
+        cells = []
+        for field in fields:
+            before, after = old[key][field], new[key][field]
+            if not before or after is None:
+                cells.append(f"{'-':>16}")
+                continue
+            change = 100 * (after - before) / before
+            mark = "!" if change > args.threshold else " "
+            regressions += change > args.threshold
+            cells.append(f"{after:>8} {change:+6.1f}%{mark}")
+        print(f"{key[0]:<10} {key[1]:<12} " + " ".join(cells))
+    for key in sorted(old.keys() ^ new.keys()):
+        print(f"{key[0]:<10} {key[1]:<12} only in "
+              + ("old" if key in old else "new") + " results")
+
+    if regressions:
+        print(f"\n{regressions} value(s) regressed more than "
+              + f"{args.threshold}% (marked with !)")
+        return 1
+    return 0
+
+
+def main(arguments):
+    parser = argparse.ArgumentParser(description = 'Model throughput \
+                                     benchmark: load time, RTF, latency and \
+                                     peak RSS')
+    commands = parser.add_subparsers(dest = 'command', metavar = 'command',
+                                     required = True)
+
+    run_parser = commands.add_parser('run', help = 'Run the benchmark')
+    run_parser.add_argument('-m', '--model', action = 'append',
+                            help = 'Model size, repeatable (default: medium)')
+    run_parser.add_argument('-p', '--profile', action = 'append',
+                            help = 'Decoding profile, repeatable \
+                            (default: default)')
+    run_parser.add_argument('-t', '--targets', default = None,
+                            help = 'targets.json with profile definitions')
+    run_parser.add_argument('--fixtures', default = common.default_fixtures,
+                            help = 'Folder of audio fixtures')
+    run_parser.add_argument('--model-location', default = "/var/models")
+    run_parser.add_argument('--warmup', type = int, default = 1,
+                            help = 'Untimed files transcribed first')
+    run_parser.add_argument('-o', '--output', default = None,
+                            help = 'Result file (default: \
+                            throughput-<timestamp>.json)')
+
+    commands.add_parser('worker', help = 'Internal, measures one run')
+
+    compare_parser = commands.add_parser('compare', help = 'Compare two \
+                                         result files')
+    compare_parser.add_argument('old')
+    compare_parser.add_argument('new')
+    compare_parser.add_argument('--threshold', type = float, default = 10.0,
+                                help = 'Allowed growth in percent')
+
+    args = parser.parse_args(arguments[1:])
+    return {'run': run, 'worker': worker, 'compare': compare}[args.command](args)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
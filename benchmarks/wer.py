@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+#
+# Word error rate of a transcript against a reference transcript
+#
+# Both texts are normalized the same way the magic words are (case, diacritics
+# and punctuation folded) before the words are compared.
+
+import common  # noqa: F401 - puts scripts/ on the module search path
+from routing import normalize
+
+
+def word_errors(reference, hypothesis):
+    """
+        Returns (errors, reference words) where errors is the number of
+        substituted, deleted and inserted words (Levenshtein distance).
+    """
+    ref = normalize(reference)
+    hyp = normalize(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1,
+                               current[j - 1] + 1,
+                               previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def word_error_rate(reference, hypothesis):
+    """ Word error rate, errors per reference word. """
+    errors, words = word_errors(reference, hypothesis)
+    if words == 0:
+        return 0.0 if errors == 0 else 1.0
+    return errors / words
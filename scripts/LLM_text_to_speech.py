@@ -1,19 +1,43 @@
 #!/usr/bin/env python3
 #
 # Author: Juha Leivo
-# Version: 1
+# Version: 11
 # Date: 2024-01-03
 #
 # History
 #   1 - 2024-01-03, initial write
-
-import whisper
+#   2 - 2026-10-19, targets.json routing index with hot reload
+#   3 - 2026-10-19, lazy whisper import, model-free subcommands
+#   4 - 2026-10-19, per-target decoding profiles
+#   5 - 2026-10-19, process_next() shared with the stress harness
+#   6 - 2026-10-19, Prometheus metrics endpoint
+#   7 - 2026-10-19, per-file profiling
+#   8 - 2026-10-19, batch command for bulk-importing archives
+#   9 - 2026-10-19, wait for uploads to finish, optional WAV tail mode
+#  10 - 2026-10-19, several monitored folders with their own default target,
+#                   model and weight, fair-share scheduled workers
+#  11 - 2026-10-19, torch thread counts from the CPU quota and topology,
+#                   optional pinning of the inference of each model to cores
+
+# whisper (and torch with it) is imported only when the model is loaded, the
+# model-free commands below must not pull it in
 import argparse
 import sys
 import time
 import os
 import json
 import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import batch
+import cpu
+import routing
+import inbox
+import tail
+import scheduler
+import metrics
+import profiling
+import setup_email
 # email joy
 import smtplib
 from email.mime.multipart import MIMEMultipart
@@ -21,33 +45,183 @@ from email.mime.text import MIMEText
 from email.mime.base import MIMEBase
 from email import encoders
 
-supported_files = [".mp3",".wav",".m4a"]
-
 # our whisper AI model
 class transciber:
 
     model_location = "/var/models"
+    target_location = "/target"
+    targets_file = "/targets.json"
+    email_file = "/email.json"
     cpu_fp = {'fp16':False}
+    # seconds decoded to find the target when targets use different profiles
+    routing_window = 30
+    sample_rate = 16000
     smtp_server = ""
     smtp_port = ""
     sender_email = ""
     config = {}
     debuginfo = False
 
-    def __init__(self,model_size = "medium", debuginfo = False):
-        self.model = whisper.load_model(model_size, download_root = self.model_location )
+    def __init__(self,model_size = "medium", debuginfo = False,
+                 profile = "default", threads = None):
         self.debuginfo = debuginfo
+        self.profile = profile
+        # before the model is loaded, torch would size its pools by the
+        # CPU count of the host
+        if threads:
+            cpu.set_torch_threads(threads)
+        # size -> (model, lock), a model is loaded when first needed and
+        # only once however many folders use it. A model runs one file at a
+        # time, the output of parallel workers goes to shared transcript files
+        self.models = {}
+        self.model_size = model_size
+        self.output_lock = threading.Lock()
+        # size -> thread running the inference of a pinned model
+        self.runners = {}
+
+    def pin_models(self,core_sets):
+        """
+            Runs the inference of each model size of core_sets in a thread of
+            its own, pinned to the CPUs of the size. The torch threads of the
+            model are started by that thread and stay on the same CPUs.
+        """
+        for model_size, cpus in core_sets.items():
+            self.runners[model_size] = ThreadPoolExecutor(
+                max_workers = 1, initializer = cpu.pin_current_thread,
+                initargs = (cpus,))
+
+    def load_model(self,model_size):
+        """ The model of the size and its inference lock, loaded once. """
+        if model_size not in self.models:
+            import whisper
+            start = time.perf_counter()
+            model = whisper.load_model(model_size, download_root = self.model_location )
+            metrics.model_load_seconds.set(time.perf_counter() - start,
+                                           model = model_size)
+            self.models[model_size] = (model, threading.Lock())
+        return(self.models[model_size])
+
+    def __model(self,model_size):
+        """ Model and lock of the size, None is the model of -m. """
+        return(self.load_model(model_size or self.model_size))
+
+    def __decode_options(self,profile,model_size = None):
+        """
+            transcribe() options of the named decoding profile, see
+            profiles.py. fp16 is turned off on CPU unless the profile sets it.
+        """
+        options = self.routes.index.profiles.get(profile)
+        if options is None:
+            print(f"WARNING: unknown decoding profile {profile}, using defaults")
+            options = {}
+        if self.__model(model_size)[0].device.type == "cpu":
+            options = {**self.cpu_fp, **options}
+        return(dict(options))
+
+    def __inference(self,audio,options,model_size = None,**extra):
+        """ Runs the model, the decoding statistics go to the profile. """
+        model, lock = self.__model(model_size)
+        runner = self.runners.get(model_size or self.model_size)
+        with lock, metrics.stage("inference"):
+            if runner:
+                result = runner.submit(model.transcribe, audio, **options,
+                                       **extra).result()
+            else:
+                result = model.transcribe(audio, **options, **extra)
+        # the part decoded, clip_timestamps is "start" or "start,end"
+        clip = str(extra.get("clip_timestamps", "0")).split(",")
+        duration = len(audio) / self.sample_rate
+        end = min(float(clip[1]), duration) if len(clip) > 1 else duration
+        windows, fallbacks = profiling.decode_stats(result, options,
+                                                    float(clip[0]), end)
+        profiling.annotate(add = True, windows = windows, fallbacks = fallbacks)
+        return(result)
+
+    def transcribe_window(self,audio,prompt = None,language = None,
+                          model_size = None):
+        """
+            Transcribes a part of a file with the default profile, the text
+            so far is given as the prompt. Used by the WAV tail mode.
+        """
+        options = self.__decode_options(self.profile, model_size)
+        if language:
+            options.setdefault("language", language)
+        if prompt and options.get("condition_on_previous_text", True):
+            options.setdefault("initial_prompt", prompt)
+        return(self.__inference(audio, options, model_size))
+
+    def needs_own_profile(self,text,fallback = 'default'):
+        """
+            True if the target of the text decodes with another profile than
+            the default one.
+        """
+        index = self.routes.index
+        return(index.profile_of(index.lookup(text, fallback).target,
+                                self.profile) != self.profile)
+
+    def transcribe(self,speech_file,fallback = 'default',model_size = None):
+        """
+            Transcribes the file with the decoding profile of its target,
+            fallback is the target of files without a magic word and
+            model_size the model to use (None for the model of -m).
+
+            If all targets use the default profile the file is decoded once.
+            Otherwise the first routing_window seconds are decoded with the
+            default profile to find the target. When the target uses the
+            default profile as well the transcription continues from where
+            the first pass ended, otherwise the whole file is decoded again
+            with the profile of the target.
+        """
+        import whisper
+        # decode separately so ffmpeg and inference time are told apart
+        with metrics.stage("decode"):
+            audio = whisper.load_audio(speech_file)
+        duration = len(audio) / self.sample_rate
+        profiling.annotate(audio_seconds = duration)
+
+        index = self.routes.index
+        if not index.uses_profiles(self.profile):
+            result = self.__inference(audio, self.__decode_options(
+                self.profile, model_size), model_size)
+            return(result["text"])
+
+        head = self.__inference(audio, self.__decode_options(self.profile,
+                                                             model_size),
+                                model_size,
+                                clip_timestamps = f"0,{self.routing_window}")
+        route = index.lookup(head["text"], fallback)
+        profile = index.profile_of(route.target, self.profile)
 
-    def transcribe(self,speech_file):
-        result = self.model.transcribe(speech_file)
-        return(result["text"])
+        if self.debuginfo:
+            print(f"DEBUG: Routing pass target {route.target}, profile {profile}")
+
+        if profile != self.profile:
+            result = self.__inference(audio, self.__decode_options(
+                profile, model_size), model_size)
+            return(result["text"])
+        if duration <= self.routing_window:
+            return(head["text"])
+
+        # The last segment of the first pass may be cut at the window end,
+        # continue after the last segment which ended well before it
+        segments = [segment for segment in head["segments"]
+                    if segment["end"] <= self.routing_window - 1]
+        resume = segments[-1]["end"] if segments else 0
+        text = "".join(segment["text"] for segment in segments)
+        options = self.__decode_options(profile, model_size)
+        options.setdefault("language", head.get("language"))
+        if text and options.get("condition_on_previous_text", True):
+            options.setdefault("initial_prompt", text)
+        rest = self.__inference(audio, options, model_size,
+                                clip_timestamps = str(resume))
+        return(text + rest["text"])
 
     def load_config(self):
         # check if email server configuration is defined in /email.json
-        if not os.path.isfile('/email.json'):
+        if not os.path.isfile(self.email_file):
             print("No email configuration")
         else:
-            with open('/email.json') as f:
+            with open(self.email_file) as f:
                 # try to load config file, exit out if not valid json
                 try:
                     emaildata = json.load(f)
@@ -65,24 +239,21 @@ class transciber:
                 print(e)
                 sys.exit(1)
 
-        with open('/targets.json') as f:
-            # try to load config file, exit out if not valid json
-            try:
-                config = json.load(f)
-            except Exception as e:
-                print("Error loading targets definition file")
-                print(e)
-                sys.exit(1)
-        
-        # verify that key default exists in the dictionary config
-        if 'default' not in config: 
-            print("Error: key default not found in config file"
-                + "/targets.json"
-                + "Exiting...."
-            )
+        # targets.json is compiled into a routing index, exit out if the
+        # file is not valid json or misses the default target
+        self.routes = routing.TargetsFile(self.targets_file)
+        try:
+            self.routes.load()
+        except routing.ConfigError as e:
+            print("Error loading targets definition file")
+            print(e)
             sys.exit(1)
 
-        self.config = config
+        self.config = self.routes.config
+
+        if self.profile not in self.routes.index.profiles:
+            print(f"Error: unknown decoding profile {self.profile}")
+            sys.exit(1)
 
         if self.debuginfo:
             print(f"Config: {self.config}")
@@ -93,39 +264,31 @@ class transciber:
             print(f"CPU FP: {self.cpu_fp}")
             print(f"Debuginfo: {self.debuginfo}")
 
-    def __get_magic_word(self,text):
+    def reload_config(self):
         """
-            Function to get the magic word for evaluation.
-            Everything that is not alphabet characters is removed and 
-            lowercased.
+            Takes a changed /targets.json into use. The model is not touched,
+            if the new file is broken the old targets stay in use.
         """
-        magic_word = text.split()[0]
-        magic_word = magic_word.strip('.,!?;:()[]"\'')
-        magic_word = magic_word.lower()
-
-        if self.debuginfo:
-            print(f"DEBUG: Magic word: {magic_word}")
-        
-        return(magic_word)
+        if self.routes.reload_if_changed():
+            self.config = self.routes.config
+            if self.debuginfo:
+                print(f"Config: {self.config}")
 
-    def __get_targeting_details(self,magic_word):
+    def __get_targeting_details(self,text,fallback):
         """
-            Function to get the targeting details for the magic word.
-            If the magic word is not in the dictionary, the default 
-            configuration is returned.
-            2024-01-08 Missing sanity checking
+            Function to get the route of the transcript.
+            The magic word (or phrase) at the start of the text is matched
+            against the routing index, see routing.py. If nothing matches the
+            fallback (by default the default) configuration is returned.
         """
-        if magic_word in self.config:
-            # get the configurion from the dictionary
-            details = self.config[magic_word]
-        else:
-            # if magic word is not in the dictionary, get the default
-            details = self.config['default']
-        
+        with metrics.stage("routing"):
+            route = self.routes.index.lookup(text, fallback)
+
         if self.debuginfo:
-            print(f"DEBUG: Targeting details: {details}")
-        
-        return(details)
+            print(f"DEBUG: Magic word: {route.matched} (fuzzy: {route.fuzzy})")
+            print(f"DEBUG: Targeting details: {route.details}")
+
+        return(route)
 
     def __create_email_message(self,text,details,folder,filename):
         """
@@ -148,25 +311,28 @@ class transciber:
             print(f"DEBUG: Subject: {subject}")
             print(f"DEBUG: Body: {body}")
     
-        if details['keepaudiofile']:
-            if self.debuginfo:
-                print(f"DEBUG: Attaching the audio file to the email.")
-            self.__send_email(receiver_email = details['email'], \
-                            subject = subject, message = body, \
-                                attachment = folder + "/" + filename)
-        else:
-            self.__send_email(receiver_email = details['email'], \
-                            subject = subject, message = body)
+        with metrics.stage("smtp"):
+            if details['keepaudiofile']:
+                if self.debuginfo:
+                    print(f"DEBUG: Attaching the audio file to the email.")
+                self.__send_email(receiver_email = details['email'], \
+                                subject = subject, message = body, \
+                                    attachment = folder + "/" + filename)
+            else:
+                self.__send_email(receiver_email = details['email'], \
+                                subject = subject, message = body)
         if self.debuginfo:
             print(f"DEBUG: Email most likely sent.")
             print(f"DEBUG: removing audiofile")
-        os.remove(folder + "/" + filename)
+        with metrics.stage("file_move"):
+            os.remove(folder + "/" + filename)
 
         return
 
-    def handle_output(self,text,folder,filename):
+    def handle_output(self,text,folder,filename,fallback = 'default'):
         """
             Public function to handle the output of the transciption.
+            fallback is the target of a text without a magic word.
 
             First checked detail is the email definition, if that exists
             everything is handled as email and sent away. However, if the 
@@ -179,15 +345,20 @@ class transciber:
                   is {filename}")
             print(f"DEBUG: {text}")
 
-        magic_word = self.__get_magic_word(text)
-        details = self.__get_targeting_details(magic_word)
+        route = self.__get_targeting_details(text,fallback)
+        details = route.details
+        outcome = "transcript"
 
         if 'email' in details:
             if self.smtp_server == "" or self.smtp_port == "" or self.sender_email == "":
                 print(f"WARNING: email configuration faulty!")
-                details = self.__get_targeting_details("default")
+                details = self.config['default']
+                outcome = "email_fallback"
             else:
                 self.__create_email_message(text,details,folder,filename)
+                metrics.files_processed.inc(target = route.target,
+                                            outcome = "email")
+                profiling.annotate(target = route.target, outcome = "email")
                 return
             
             
@@ -199,7 +370,7 @@ class transciber:
             target_filename = details['filename']
         # Append the text to the file located in details['transcript'] folder 
         # with the filename details['filename']. Create file, if it doesn't exist
-        with open("/target/" + details['transcript'] + "/" + target_filename, 'a') as f:
+        with open(self.target_location + "/" + details['transcript'] + "/" + target_filename, 'a') as f:
             # check if details require timestamp (timestamp: True) and prepend
             # timestamp to the text in the format of YYYY-MM-DD HH:MM:SS
             if 'timestamp' in details and details['timestamp']:
@@ -211,22 +382,27 @@ class transciber:
             if 'keepaudiofile' in details and details['keepaudiofile']:
                 # check if target file name is already taken, if it is, append a unix 
                 # epoch time stamp to the file name just before the file type
-                if os.path.isfile("/target/" + details['keepaudiofile'] + "/" + filename):
+                if os.path.isfile(self.target_location + "/" + details['keepaudiofile'] + "/" + filename):
                     print("File name already taken, appending unix epoch time stamp to file name")
                     filename_epoch = filename.rsplit('.', 0)[0] + "_" + str(int(time.time())) + "." + filename.split('.')[-1]
                     print(f"Moving audio file {filename_epoch} to {details['keepaudiofile']}")
                     # file rename using shutil.move in case the folders map to different filesystems
-                    shutil.move(folder + "/" + filename, "/target/" + details['keepaudiofile'] + "/" + filename_epoch)
+                    with metrics.stage("file_move"):
+                        shutil.move(folder + "/" + filename, self.target_location + "/" + details['keepaudiofile'] + "/" + filename_epoch)
                     f.write(f"![[{filename_epoch}]]")
                 else:
                     print(f"Moving audio file {filename} to {details['keepaudiofile']}")
-                    shutil.move(folder + "/" + filename, "/target/" + details['keepaudiofile'] + "/" + filename)
+                    with metrics.stage("file_move"):
+                        shutil.move(folder + "/" + filename, self.target_location + "/" + details['keepaudiofile'] + "/" + filename)
                     f.write(f"![[{filename}]]")
             else:
                 print(f"Removing file {filename}")
-                os.remove(folder + "/" + filename)
+                with metrics.stage("file_move"):
+                    os.remove(folder + "/" + filename)
                 
             f.close()
+        metrics.files_processed.inc(target = route.target, outcome = outcome)
+        profiling.annotate(target = route.target, outcome = outcome)
 
     def __send_email(self, receiver_email, subject, message, attachment=None):
 
@@ -260,56 +436,398 @@ class transciber:
 ################################# FUNCTIONS ###################################
 
 def init(arguments):
-    parser = argparse.ArgumentParser(arguments, description='Speech-to-Text tool')
+    parser = argparse.ArgumentParser(description='Speech-to-Text tool')
     parser.add_argument('-m','--model', required = False, help = 'Whisper AI \
                         model size to run: small, medium(default), large',
                         default = "medium")
-    parser.add_argument('-f','--folder', required = False, help = 'Folder to \
-                        monitor', default = "/audio")
+    parser.add_argument('-f','--folder', required = False, action = 'append',
+                        metavar = 'PATH[,target=NAME][,model=SIZE][,weight=N]',
+                        help = 'Folder to monitor (default: /audio), repeat \
+                        for several folders. target is used for files \
+                        without a magic word, model instead of -m, weight \
+                        is the share of the workers (default: 1)')
+    parser.add_argument('-w','--workers', required = False, type = int, \
+                        default = 2, help = 'Files handled in parallel, \
+                        also by batch (default: 2)')
+    parser.add_argument('-t','--targets', required = False, help = 'Targets \
+                        definition file', default = transciber.targets_file)
+    parser.add_argument('-e','--email', required = False, help = 'Email \
+                        configuration file', default = transciber.email_file)
+    parser.add_argument('-p','--decoding-profile', required = False, help = \
+                        'Decoding profile of targets without one, also used \
+                        to find the target', default = "default")
+    parser.add_argument('--profile', required = False, metavar = 'FILE', \
+                        help = 'Write a JSON profile record per file to FILE')
+    parser.add_argument('--profile-slow', required = False, type = float, \
+                        metavar = 'SECONDS', help = 'Save a cProfile dump of \
+                        files slower than this')
+    parser.add_argument('--profile-dumps', required = False, help = 'Folder \
+                        of the profile dumps (default: next to FILE)')
+    parser.add_argument('--profile-torch', default = False, action = \
+                        "store_true", help = 'Include a torch profiler trace \
+                        in the dumps')
+    parser.add_argument('--settle', required = False, type = float, \
+                        default = 2.0, metavar = 'SECONDS', help = 'A file is \
+                        handled once its size and time stamp have not changed \
+                        for this long (default: 2)')
+    parser.add_argument('--threads', required = False, type = int, \
+                        help = 'torch threads per inference (default: cores \
+                        allowed by the CPU quota and affinity, divided \
+                        between parallel inferences)')
+    parser.add_argument('--pin-models', default = False, action = \
+                        "store_true", help = 'Run the inference of every \
+                        model on its own set of cores')
+    parser.add_argument('--tail-wav', default = False, action = "store_true", \
+                        help = 'Transcribe finished 30 second windows of WAV \
+                        files while they are being uploaded')
+    parser.add_argument('--metrics-port', required = False, type = int, \
+                        help = 'Serve Prometheus metrics on this port')
+    parser.add_argument('--metrics-address', required = False, help = \
+                        'Address of the metrics endpoint', default = "127.0.0.1")
     parser.add_argument('-d','--debug', default = False, action="store_true", \
                         help = 'Enable Debug mode')
-    
+
+    # Model-free commands, these never load whisper
+    commands = parser.add_subparsers(dest = 'command', metavar = 'command')
+    commands.add_parser('run', help = 'Monitor the folder and transcribe \
+                        (default)')
+    check = commands.add_parser('check-config', help = 'Validate targets and \
+                                email configuration')
+    check.add_argument('--smtp', default = False, action = "store_true",
+                       help = 'Also test the SMTP server connection')
+    route = commands.add_parser('route', help = 'Show the target a \
+                                transcript would be routed to')
+    route.add_argument('text', help = 'Transcript text')
+    queue = commands.add_parser('queue-status', help = 'Show the files \
+                                waiting in the monitored folder')
+    queue.add_argument('--json', default = False, action = "store_true",
+                       help = 'Print the status as JSON')
+    bulk = commands.add_parser('batch', help = 'Handle every file of a folder \
+                               tree once and exit')
+    bulk.add_argument('batch_folder', nargs = '?', metavar = 'folder',
+                      help = 'Folder tree to handle (default: the first \
+                      --folder)')
+    # the same option as the global one, may be given after the command too
+    bulk.add_argument('-w', '--workers', type = int,
+                      default = argparse.SUPPRESS,
+                      help = 'Files handled in parallel (default: 2)')
+    bulk.add_argument('--checkpoint', help = 'Checkpoint file (default: \
+                      .stt-batch-checkpoint.jsonl in the folder)')
+    bulk.add_argument('--retry-failed', default = False, action = "store_true",
+                      help = 'Retry the files which failed on earlier runs')
+
+    results = parser.parse_args(arguments[1:])
+    if results.command is None:
+        results.command = 'run'
+
+    results.sources = [inbox.parse_source(spec)
+                       for spec in results.folder or ["/audio"]]
+    paths = [os.path.abspath(source.path) for source in results.sources]
+    if len(set(paths)) != len(paths):
+        raise Exception("The same folder is given more than once")
+    if results.workers < 1:
+        raise Exception("--workers must be at least 1")
+    if results.threads is not None and results.threads < 1:
+        raise Exception("--threads must be at least 1")
+    for option, value in (("--profile-slow", results.profile_slow),
+                          ("--profile-dumps", results.profile_dumps),
+                          ("--profile-torch", results.profile_torch)):
+        if value is not None and value is not False \
+                and results.profile is None:
+            raise Exception(f"{option} needs --profile")
+
     # verify that /targets.json exists
-    if not os.path.isfile('/targets.json'):
-        raise Exception("File /targets.json not found")
-    try:
-        results = parser.parse_args()
-    except argparse.ArgumentError as e:
-        raise(e)
+    if results.command in ('run', 'batch', 'check-config', 'route') \
+            and not os.path.isfile(results.targets):
+        raise Exception(f"File {results.targets} not found")
     return results
 
 
-################################### LOGIC #####################################
+def check_config(args):
+    """
+        Validates the targets and email configuration without loading the
+        model. Returns the exit status.
+    """
+    status = 0
+    try:
+        index = routing.TargetsFile(args.targets).load()
+        print(f"{args.targets}: OK, {len(index.config)} targets")
+        for phrase, target in sorted(index.phrases.items()):
+            print(f"  {' '.join(phrase)} -> {target}")
+        for name, options in sorted(index.profiles.items()):
+            print(f"  profile {name}: {json.dumps(options)}")
+        if args.decoding_profile not in index.profiles:
+            print(f"Unknown decoding profile {args.decoding_profile}")
+            status = 1
+        for source in args.sources:
+            if source.target not in index.config:
+                print(f"Unknown target {source.target} of folder "
+                      + source.path)
+                status = 1
+    except routing.ConfigError as e:
+        print(f"{args.targets}: {e}")
+        status = 1
+
+    if not os.path.isfile(args.email):
+        print(f"{args.email}: not found, email targets are disabled")
+        return status
 
-def main(arguments):
-    try: 
-        args = init(arguments)
-    except Exception as e:
+    try:
+        with open(args.email) as f:
+            emaildata = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"{args.email}: {e}")
+        return 1
+    if not setup_email.validate_email_config_data(emaildata,
+                                                  test_connection = args.smtp):
+        return 1
+    print(f"{args.email}: OK")
+    return status
+
+
+def show_route(args):
+    """ Prints the target the text would be routed to. """
+    try:
+        index = routing.TargetsFile(args.targets).load()
+    except routing.ConfigError as e:
         print(e)
-        sys.exit(1)
+        return 1
+    route = index.lookup(args.text)
+    print(f"Target: {route.target}")
+    print(f"Magic word: {route.matched} (fuzzy: {route.fuzzy})")
+    print(f"Profile: {index.profile_of(route.target, args.decoding_profile)}")
+    print(f"Details: {json.dumps(route.details)}")
+    return 0
+
+
+def show_queue_status(args):
+    """
+        Prints the files waiting in the monitored folders, with --json one
+        line per folder.
+    """
+    status_code = 0
+    for source in args.sources:
+        try:
+            status = inbox.queue_status(source.path)
+        except OSError as e:
+            print(e)
+            status_code = 1
+            continue
+        if args.json:
+            print(json.dumps(status))
+        else:
+            print(f"Folder: {status['folder']}")
+            print(f"Files waiting: {status['files']} ({status['bytes']} bytes)")
+            print(f"Oldest file age: {status['oldest_age_seconds']} s")
+    return status_code
 
-    print("Starting whisper AI with model {}".format(args.model))
-    AI = transciber(args.model,args.debug)
+
+################################### LOGIC #####################################
+
+def process_next(AI,queue,tails = None):
+    """
+        Transcribes and handles the next file the scheduler.FairShare queue
+        hands out. Returns the name of the handled file, None if no file had
+        finished uploading. A file which fails is left in place and skipped
+        until it changes.
+    """
+    with metrics.stage("discovery"):
+        claim = queue.claim()
+    if claim is None:
+        return None
+    item, source = claim.item, claim.share.source
+    start = time.perf_counter()
+    failed = False
+    try:
+        process_file(AI,item.folder,item.filename,tails,source)
+    except Exception as e:
+        print(f"ERROR: handling {item.filename} failed: {e}")
+        metrics.files_processed.inc(target = "", outcome = "error")
+        failed = True
+    seconds = time.perf_counter() - start
+    queue.release(claim, seconds, failed)
+    metrics.folder_files.inc(folder = source.path)
+    metrics.folder_worker_seconds.inc(seconds, folder = source.path)
+    return item.filename
+
+def process_file(AI,folder,filename,tails = None,source = None):
+    """
+        Transcribes and handles one file of the inbox.Source. A file
+        transcribed in tail mode only has its last window left, unless its
+        target decodes with a profile of its own.
+    """
+    target = source.target if source else 'default'
+    model_size = source.model if source else None
+    path = folder + "/" + filename
+    with profiling.trace_file(path), metrics.stage("file"):
+        print("Transcribing " + filename)
+        text = tails.finish(AI,path) if tails else None
+        if text is not None and AI.needs_own_profile(text,target):
+            text = None
+        if text is None:
+            text = AI.transcribe(path,target,model_size)
+        print("Transcribed text from file " + filename)
+        with AI.output_lock, metrics.stage("output"):
+            AI.handle_output(text,folder,filename,target)
+
+def cpu_settings(args,sources,workers):
+    """
+        torch threads per inference and the CPUs of each model size (None
+        when not pinned). A model runs one file at a time, the usable cores
+        are divided between the models which can run at the same time.
+        OMP_NUM_THREADS is left alone when set.
+    """
+    topology = cpu.detect()
+    models = sorted({source.model or args.model for source in sources})
+    pinning = None
+    if args.pin_models:
+        # every model keeps its cores even while another one is idle
+        parallel = len(models)
+        pinning = dict(zip(models, cpu.core_sets(topology, len(models))))
+    else:
+        parallel = min(workers, len(models))
+    threads = args.threads
+    if threads is None and "OMP_NUM_THREADS" not in os.environ:
+        threads = cpu.threads_per_inference(topology, parallel)
+    print(f"CPU: {cpu.describe(topology)}, "
+          + f"{threads or os.environ.get('OMP_NUM_THREADS')} threads per "
+          + "inference")
+    return threads, pinning
+
+def start_transciber(args,sources,threads = None,pinning = None):
+    """
+        Starts the optional metrics and profiling, loads the models of the
+        sources and the config. pinning maps model sizes to their CPUs.
+    """
+    if args.metrics_port:
+        metrics.serve(args.metrics_port, args.metrics_address)
+        for source in sources:
+            metrics.watch_folder(source.path, inbox.queue_status)
+        print(f"Serving metrics on {args.metrics_address}:{args.metrics_port}")
+
+    if args.profile:
+        profiling.start(args.profile, args.profile_slow, args.profile_dumps,
+                        args.profile_torch)
+        print(f"Writing file profiles to {args.profile}")
+
+    transciber.targets_file = args.targets
+    transciber.email_file = args.email
+    AI = transciber(args.model,args.debug,args.decoding_profile,threads)
+    # only the models the folders use, -m is the model of folders without one
+    for model_size in sorted({source.model or args.model
+                              for source in sources}):
+        print("Starting whisper AI with model {}".format(model_size))
+        AI.load_model(model_size)
+    if pinning:
+        for model_size, cpus in pinning.items():
+            print(f"Model {model_size} pinned to CPUs {sorted(cpus)}")
+        AI.pin_models(pinning)
     print("Whisper AI started")
 
     print("Loading config file")
-    # Config files are always the /targets.json and /email.json
+    # Config files are by default /targets.json and /email.json
     AI.load_config()
+    for source in sources:
+        if source.target not in AI.config:
+            print(f"Error: unknown target {source.target} of folder "
+                  + source.path)
+            sys.exit(1)
     print("Config file(s) loaded")
+    return AI
 
-    # start monitoring given folder to files
-    print("Monitoring folder " + args.folder)
+def work(AI,queue,tails = None):
+    """ Worker thread, handles files as long as the process runs. """
+    while True:
+        # sleep only when there was nothing to do, a queue of files is
+        # handled back to back
+        if process_next(AI,queue,tails) is None:
+            if not (tails and tails.advance(AI, queue.growing_files())):
+                time.sleep(1)
+
+def run(args):
+    threads, pinning = cpu_settings(args,args.sources,args.workers)
+    AI = start_transciber(args,args.sources,threads,pinning)
+
+    # start monitoring given folders to files
+    shares = []
+    for source in args.sources:
+        print(f"Monitoring folder {source.path} (target {source.target}, "
+              + f"model {source.model or args.model}, "
+              + f"weight {source.weight:g})")
+        shares.append(scheduler.Share(source,
+                                      inbox.Inbox(source.path, args.settle)))
+    queue = scheduler.FairShare(shares)
+    tails = tail.TailTranscriptions({source.path: source.model
+                                     for source in args.sources}) \
+        if args.tail_wav else None
+    workers = [threading.Thread(target = work, args = (AI, queue, tails),
+                                daemon = True)
+               for _ in range(args.workers)]
+    for worker in workers:
+        worker.start()
     while True:
-        for filename in os.listdir(args.folder):
-            # check if the file ending is one of the supported ones
-            if not filename.endswith(tuple(supported_files)):
-                continue
-            print("Transcribing " + filename)
-            text = AI.transcribe(args.folder + "/" + filename)
-            print("Transcribed text from file " + filename)
-            AI.handle_output(text,args.folder,filename)
-            break
         time.sleep(1)
+        # a worker stops only on an unexpected error (e.g. a folder which
+        # disappeared), exit so the container gets restarted
+        if not all(worker.is_alive() for worker in workers):
+            print("ERROR: a worker stopped, exiting")
+            sys.exit(1)
+        AI.reload_config()
+
+def run_batch(args):
+    """
+        Handles every audio file of the folder tree once and exits. Finished
+        and failed files are written to a checkpoint, a rerun skips them.
+    """
+    source = args.sources[0]
+    if args.batch_folder:
+        source = inbox.Source(args.batch_folder, 'default', None, 1.0)
+    folder = source.path
+    checkpoint = batch.Checkpoint(args.checkpoint or
+                                  os.path.join(folder, batch.checkpoint_name))
+    found = batch.walk_files(folder)
+    files = [file for file in found if file not in checkpoint.done
+             and (args.retry_failed or file not in checkpoint.failed)]
+    print(f"{len(files)} files to handle in {folder}, "
+          + f"{len(found) - len(files)} skipped as already handled or "
+          + f"failed (checkpoint {checkpoint.path})")
+    if not files:
+        return 1 if checkpoint.failed and not args.retry_failed else 0
+
+    threads, pinning = cpu_settings(args,[source],args.workers)
+    AI = start_transciber(args,[source],threads,pinning)
+    summary = batch.run_batch(folder, files,
+                              lambda directory, filename:
+                                  process_file(AI,directory,filename,
+                                               source = source),
+                              checkpoint, args.workers)
+
+    print(f"\nHandled {summary['handled']}/{summary['files']} files in "
+          + f"{batch.format_duration(summary['seconds'])}, "
+          + f"{summary['files_per_second']} files/s, "
+          + f"{summary['failed']} failed")
+    for file, error in sorted(checkpoint.failed.items()):
+        print(f"FAILED: {file}: {error}")
+    if summary['interrupted']:
+        print("Interrupted, run the same command again to continue")
+    return 1 if summary['failed'] or checkpoint.failed \
+        or summary['interrupted'] else 0
+
+def main(arguments):
+    try: 
+        args = init(arguments)
+    except Exception as e:
+        print(e)
+        sys.exit(1)
+
+    commands = {
+        'run': run,
+        'batch': run_batch,
+        'check-config': check_config,
+        'route': show_route,
+        'queue-status': show_queue_status,
+    }
+    sys.exit(commands[args.command](args))
 
 if __name__ == "__main__":
     main(sys.argv)
\ No newline at end of file
@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+#
+# One-shot bulk processing of an existing archive of recordings
+#
+# The folder tree is walked once, the files are handled by a pool of worker
+# threads and every finished file is written to a checkpoint file, so an
+# interrupted run can be resumed where it stopped. Inference itself runs one
+# file at a time (see transciber.transcribe), the workers overlap it with
+# audio decoding, routing, file moves and email.
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import inbox
+
+checkpoint_name = ".stt-batch-checkpoint.jsonl"
+
+
+class Checkpoint:
+    """
+        JSON lines file with one {"file", "status", "error"} record per
+        handled file, paths relative to the batch folder.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.done = set()
+        self.failed = {}
+        if os.path.isfile(path):
+            with open(path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # a line cut short by a crash
+                        continue
+                    if record["status"] == "done":
+                        self.done.add(record["file"])
+                        self.failed.pop(record["file"], None)
+                    else:
+                        self.failed[record["file"]] = record.get("error")
+
+    def record(self, file, error = None):
+        status = "done" if error is None else "failed"
+        with self.lock:
+            if error is None:
+                self.done.add(file)
+                self.failed.pop(file, None)
+            else:
+                self.failed[file] = error
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"file": file, "status": status,
+                                    "error": error}) + "\n")
+
+
+def walk_files(folder):
+    """ Supported audio files in the folder tree, relative paths, sorted. """
+    files = []
+    for root, dirs, filenames in os.walk(folder):
+        for filename in filenames:
+            if inbox.is_supported(filename):
+                files.append(os.path.relpath(os.path.join(root, filename),
+                                             folder))
+    return sorted(files)
+
+
+def format_duration(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+class Progress:
+    """ Prints throughput and ETA at most every interval seconds. """
+
+    def __init__(self, total, interval = 5.0):
+        self.total = total
+        self.interval = interval
+        self.handled = 0
+        self.failed = 0
+        self.start = time.monotonic()
+        self.printed = 0.0
+
+    def update(self, failed = False):
+        self.handled += 1
+        self.failed += failed
+        now = time.monotonic()
+        if now - self.printed < self.interval and self.handled < self.total:
+            return
+        self.printed = now
+        elapsed = now - self.start
+        rate = self.handled / elapsed if elapsed else 0.0
+        eta = (self.total - self.handled) / rate if rate else 0.0
+        print(f"[{self.handled}/{self.total}] {rate:.2f} files/s, "
+              + f"{self.failed} failed, elapsed {format_duration(elapsed)}, "
+              + f"ETA {format_duration(eta)}")
+
+
+def run_batch(folder, files, process, checkpoint, workers = 2,
+              progress_interval = 5.0):
+    """
+        Handles the files (relative to folder) with process(folder, filename)
+        in a pool of worker threads. Returns a summary dictionary.
+    """
+    progress = Progress(len(files), progress_interval)
+    start = time.monotonic()
+    interrupted = False
+
+    def handle(file):
+        directory, filename = os.path.split(os.path.join(folder, file))
+        try:
+            process(directory, filename)
+        except Exception as e:
+            print(f"ERROR: {file}: {e}")
+            checkpoint.record(file, repr(e))
+            return False
+        checkpoint.record(file)
+        return True
+
+    executor = ThreadPoolExecutor(max_workers = workers)
+    try:
+        futures = [executor.submit(handle, file) for file in files]
+        for future in as_completed(futures):
+            progress.update(failed = not future.result())
+    except KeyboardInterrupt:
+        interrupted = True
+        print("Interrupted, finishing the files being handled")
+    finally:
+        executor.shutdown(wait = True, cancel_futures = True)
+
+    elapsed = time.monotonic() - start
+    return {
+        "files": len(files),
+        "handled": progress.handled,
+        "failed": progress.failed,
+        "interrupted": interrupted,
+        "seconds": round(elapsed, 1),
+        "files_per_second": round(progress.handled / elapsed, 2)
+                            if elapsed else 0.0,
+    }
@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+#
+# CPU topology and the thread counts of inference
+#
+# torch sizes its thread pools by the CPU count of the host. In a container
+# limited to a few CPUs on a many-core host that makes dozens of threads
+# fight for a few CPUs, and two hyperthreads of one core don't multiply
+# matrices faster than the core alone. The CPUs usable for inference are the
+# physical cores of the affinity mask, limited by the cgroup CPU quota, and
+# they are shared by the inferences which can run at the same time.
+#
+# The inference of each model can also be pinned to a set of cores of its
+# own, the sets stay within one NUMA node when the cores allow it.
+
+import os
+from collections import namedtuple
+
+cgroup_root = "/sys/fs/cgroup"
+cpu_root = "/sys/devices/system/cpu"
+
+# cpus are the hyperthreads of the core
+Core = namedtuple('Core', ['node', 'package', 'core', 'cpus'])
+Topology = namedtuple('Topology', ['cpus', 'cores', 'quota'])
+
+
+def parse_cpulist(text):
+    """ CPU numbers of a list like 0-3,8,10-11. """
+    cpus = []
+    for part in text.strip().split(","):
+        if not part:
+            continue
+        first, _, last = part.partition("-")
+        cpus.extend(range(int(first), int(last or first) + 1))
+    return cpus
+
+
+def read_file(path):
+    with open(path) as f:
+        return f.read().strip()
+
+
+def cgroup_quota(root = cgroup_root):
+    """
+        CPUs the cgroup CPU quota allows (may be fractional), None when
+        there is no quota. cgroup v2 and v1 are supported.
+    """
+    try:
+        # v2: "max 100000" or "<quota> <period>"
+        quota, period = read_file(os.path.join(root, "cpu.max")).split()
+        return None if quota == "max" else int(quota) / int(period)
+    except (OSError, ValueError):
+        pass
+    for folder in ("cpu", "cpu,cpuacct"):
+        try:
+            quota = int(read_file(os.path.join(root, folder,
+                                               "cpu.cfs_quota_us")))
+            period = int(read_file(os.path.join(root, folder,
+                                                "cpu.cfs_period_us")))
+        except (OSError, ValueError):
+            continue
+        return None if quota <= 0 else quota / period
+    return None
+
+
+def allowed_cpus():
+    """ CPUs of the affinity mask of the process. """
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count() or 1))
+
+
+def physical_cores(cpus, root = cpu_root):
+    """
+        Groups the CPUs by physical core, sorted by NUMA node. A CPU without
+        topology information counts as a core of its own.
+    """
+    found = {}
+    for cpu in cpus:
+        folder = os.path.join(root, f"cpu{cpu}")
+        try:
+            package = int(read_file(os.path.join(folder, "topology",
+                                                 "physical_package_id")))
+            core = int(read_file(os.path.join(folder, "topology", "core_id")))
+        except (OSError, ValueError):
+            package, core = 0, cpu
+        node = 0
+        try:
+            for entry in os.listdir(folder):
+                if entry.startswith("node") and entry[4:].isdigit():
+                    node = int(entry[4:])
+        except OSError:
+            pass
+        found.setdefault((node, package, core), []).append(cpu)
+    return [Core(node, package, core, tuple(sorted(cpus)))
+            for (node, package, core), cpus in sorted(found.items())]
+
+
+def detect(cpus = None, cgroup = cgroup_root, sysfs = cpu_root):
+    """ Topology of the CPUs this process may use. """
+    cpus = allowed_cpus() if cpus is None else cpus
+    return Topology(cpus, physical_cores(cpus, sysfs), cgroup_quota(cgroup))
+
+
+def usable_cores(topology):
+    """ Physical cores inference can keep busy, at least 1. """
+    cores = len(topology.cores)
+    if topology.quota is not None:
+        cores = min(cores, int(topology.quota))
+    return max(1, cores)
+
+
+def threads_per_inference(topology, parallel = 1):
+    """ torch threads of each of the parallel inferences. """
+    return max(1, usable_cores(topology) // max(1, parallel))
+
+
+def core_sets(topology, count):
+    """
+        Splits the usable cores into count sets of neighbouring cores, as
+        sets of CPU numbers (hyperthreads included). With more sets than
+        cores the cores are shared.
+    """
+    cores = topology.cores[:usable_cores(topology)]
+    if count >= len(cores):
+        return [set(cores[i % len(cores)].cpus) for i in range(count)]
+    sets = []
+    for i in range(count):
+        part = cores[i * len(cores) // count:(i + 1) * len(cores) // count]
+        sets.append({cpu for core in part for cpu in core.cpus})
+    return sets
+
+
+def describe(topology):
+    nodes = len({core.node for core in topology.cores})
+    quota = "no quota" if topology.quota is None \
+        else f"quota {topology.quota:g} CPUs"
+    return (f"{len(topology.cpus)} CPUs, {len(topology.cores)} cores, "
+            + f"{nodes} NUMA node{'s' if nodes > 1 else ''}, {quota}")
+
+
+def set_torch_threads(threads, interop_threads = 1):
+    """
+        Sets the torch intra-op threads. Whisper doesn't use inter-op
+        parallelism, one inter-op thread is enough.
+    """
+    import torch
+    torch.set_num_threads(threads)
+    try:
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        # can be set only once, before any inter-op work
+        pass
+
+
+def pin_current_thread(cpus):
+    """
+        Pins the calling thread (pid 0 on Linux), threads started by it
+        (torch pools, ffmpeg) inherit the mask.
+    """
+    os.sched_setaffinity(0, cpus)
@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+#
+# Discovery of the audio files waiting in the monitored folders
+#
+# Kept free of the heavy whisper / torch imports so the model-free commands
+# (queue-status, health checks) start fast.
+#
+# Sync clients write the files in place, a file is handed out only once its
+# size and modification time have stayed the same for a while. Files which
+# failed are not handed out again until they change.
+
+import os
+import time
+from collections import namedtuple
+
+supported_files = [".mp3",".wav",".m4a"]
+
+PendingFile = namedtuple('PendingFile', ['folder', 'filename', 'size', 'mtime'])
+
+# a monitored folder, files without a magic word go to target, model None is
+# the model of -m, weight is the share of the workers (see scheduler.py)
+Source = namedtuple('Source', ['path', 'target', 'model', 'weight'])
+
+
+def is_supported(filename):
+    """ True if the file ending is one of the supported ones. """
+    return filename.lower().endswith(tuple(supported_files))
+
+
+def parse_source(spec):
+    """
+        Parses a --folder value PATH[,target=NAME][,model=SIZE][,weight=N]
+        into a Source. Raises ValueError.
+    """
+    path, *options = spec.split(",")
+    values = {"target": "default", "model": None, "weight": "1"}
+    for option in options:
+        key, separator, value = option.partition("=")
+        if not separator or not value or key not in values:
+            raise ValueError(f"{spec}: unknown folder option '{option}'")
+        values[key] = value
+    try:
+        weight = float(values["weight"])
+    except ValueError:
+        raise ValueError(f"{spec}: weight must be a number")
+    if not weight > 0:
+        raise ValueError(f"{spec}: weight must be greater than 0")
+    return Source(path, values["target"], values["model"], weight)
+
+
+def pending_files(folder):
+    """
+        Lists the supported audio files in the folder, oldest first. Files
+        which disappear while listing are skipped.
+    """
+    pending = []
+    for filename in os.listdir(folder):
+        if not is_supported(filename):
+            continue
+        try:
+            stat = os.stat(os.path.join(folder, filename))
+        except FileNotFoundError:
+            continue
+        pending.append(PendingFile(folder, filename, stat.st_size,
+                                   stat.st_mtime))
+    pending.sort(key = lambda item: item.mtime)
+    return pending
+
+
+def queue_status(folder, now = None):
+    """ Summary of the files waiting in the folder as a dictionary. """
+    pending = pending_files(folder)
+    now = time.time() if now is None else now
+    return {
+        "folder": folder,
+        "files": len(pending),
+        "bytes": sum(item.size for item in pending),
+        "oldest_age_seconds": round(now - pending[0].mtime, 1)
+                              if pending else 0.0,
+    }
+
+
+class Inbox:
+    """
+        The monitored folder. ready_files() returns the files which have
+        stopped growing, growing_files() the ones still being written.
+    """
+
+    def __init__(self, folder, settle_seconds = 2.0, clock = time.monotonic):
+        self.folder = folder
+        self.settle_seconds = settle_seconds
+        self.clock = clock
+        # path -> ((size, mtime), clock when first seen with that stamp)
+        self.seen = {}
+        # path -> (size, mtime) of the version which failed
+        self.failures = {}
+        self.growing = []
+
+    def ready_files(self):
+        """ Files which haven't changed for settle_seconds, oldest first. """
+        now = self.clock()
+        seen = {}
+        ready = []
+        growing = []
+        for item in pending_files(self.folder):
+            path = os.path.join(item.folder, item.filename)
+            stamp = (item.size, item.mtime)
+            previous = self.seen.get(path)
+            since = previous[1] if previous and previous[0] == stamp else now
+            seen[path] = (stamp, since)
+            if self.failures.get(path) == stamp:
+                continue
+            if item.size > 0 and now - since >= self.settle_seconds:
+                ready.append(item)
+            else:
+                growing.append(item)
+        self.seen = seen
+        self.growing = growing
+        # forget failures of files which are gone
+        self.failures = {path: stamp for path, stamp in self.failures.items()
+                         if path in seen}
+        return ready
+
+    def growing_files(self):
+        """ Files still being written at the last ready_files() call. """
+        return self.growing
+
+    def failed(self, item):
+        """ Skips the file until it changes. """
+        self.failures[os.path.join(item.folder, item.filename)] = \
+            (item.size, item.mtime)
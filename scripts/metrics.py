@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+#
+# Prometheus metrics of the transcription service
+#
+# A small stand-alone implementation of counters, gauges and histograms in the
+# Prometheus text format, no client library needed in the image. The values
+# are always collected, the HTTP endpoint is started only when asked for:
+#
+#   metrics.serve(9100)  ->  http://localhost:9100/metrics
+
+import contextlib
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# seconds, from a millisecond file move up to a 10 minute inference
+default_buckets = (0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+                   30, 60, 120, 300, 600)
+
+registry = []
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"') \
+                          .replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.lock = threading.Lock()
+        self.values = {}
+        registry.append(self)
+
+    def samples(self):
+        """ (suffix, labels, value) tuples of the metric. """
+        with self.lock:
+            return [("", labels, value) for labels, value
+                    in sorted(self.values.items())]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}",
+                 f"# TYPE {self.name} {self.kind}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_labels(labels)} "
+                         + format_value(value))
+        return lines
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def inc(self, amount = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """ Set directly, or read from a function when scraped. """
+    kind = "gauge"
+
+    def __init__(self, name, help):
+        super().__init__(name, help)
+        self.functions = {}
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[tuple(sorted(labels.items()))] = value
+
+    def set_function(self, function, **labels):
+        with self.lock:
+            self.functions[tuple(sorted(labels.items()))] = function
+
+    def samples(self):
+        samples = super().samples()
+        with self.lock:
+            functions = sorted(self.functions.items())
+        for labels, function in functions:
+            try:
+                samples.append(("", labels, function()))
+            except Exception:
+                # a failing source (e.g. a removed folder) is left out
+                continue
+        return samples
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets = default_buckets):
+        super().__init__(name, help)
+        self.buckets = tuple(buckets) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * len(self.buckets), 0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        samples = []
+        with self.lock:
+            items = sorted((key, (list(counts), total))
+                           for key, (counts, total) in self.values.items())
+        for labels, (counts, total) in items:
+            for bound, count in zip(self.buckets, counts):
+                samples.append(("_bucket", labels
+                                + (("le", format_value(bound)),), count))
+            samples.append(("_sum", labels, total))
+            samples.append(("_count", labels, counts[-1]))
+        return samples
+
+
+def resident_memory():
+    """ Resident set size of this process in bytes (Linux). """
+    with open("/proc/self/statm") as f:
+        pages = int(f.read().split()[1])
+    return pages * os.sysconf("SC_PAGE_SIZE")
+
+
+############################# SERVICE METRICS #################################
+
+stage_seconds = Histogram("stt_stage_seconds",
+                          "Time spent per processing stage of a file")
+files_processed = Counter("stt_files_processed_total",
+                          "Files handled per target and outcome")
+queue_files = Gauge("stt_queue_files",
+                    "Audio files waiting in the monitored folder")
+queue_oldest_age = Gauge("stt_queue_oldest_file_age_seconds",
+                         "Age of the oldest waiting audio file")
+folder_files = Counter("stt_folder_files_total",
+                       "Files handled per monitored folder")
+folder_worker_seconds = Counter("stt_folder_worker_seconds_total",
+                                "Worker time used per monitored folder")
+model_load_seconds = Gauge("stt_model_load_seconds",
+                           "Time it took to load each Whisper model")
+memory = Gauge("process_resident_memory_bytes",
+               "Resident memory size in bytes")
+memory.set_function(resident_memory)
+
+
+# called with (stage, wall seconds, CPU seconds) after every stage, see
+# profiling.py
+stage_hooks = []
+
+
+@contextlib.contextmanager
+def stage(name):
+    """ Times the with block into the stage histogram. """
+    start, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield
+    finally:
+        wall = time.perf_counter() - start
+        stage_seconds.observe(wall, stage = name)
+        for hook in stage_hooks:
+            hook(name, wall, time.process_time() - cpu)
+
+
+def watch_folder(folder, status_function):
+    """
+        Reports the queue of the folder, status_function returns the
+        inbox.queue_status() dictionary.
+    """
+    queue_files.set_function(lambda: status_function(folder)["files"],
+                             folder = folder)
+    queue_oldest_age.set_function(
+        lambda: status_function(folder)["oldest_age_seconds"],
+        folder = folder)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # scrapes every few seconds would flood the container log
+        pass
+
+
+def serve(port, address = "127.0.0.1"):
+    """ Starts the /metrics endpoint in a background thread. """
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target = server.serve_forever, daemon = True)
+    thread.start()
+    return server
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+#
+# Named decoding profiles for whisper
+#
+# A profile is a set of options for model.transcribe(). The built in ones can
+# be extended or overridden in the "profiles" section of targets.json:
+#
+#   "profiles": { "fi-fast": { "base": "fast", "language": "fi" } }
+
+import copy
+
+builtin_profiles = {
+    # library defaults: language detection, temperature fallback, context
+    "default": {},
+    # greedy decoding without fallback or context from the previous window
+    "fast": {"temperature": 0.0, "condition_on_previous_text": False},
+    # beam search, fallback kept for the hard cases
+    "accurate": {"beam_size": 5, "best_of": 5},
+}
+
+# transcribe() options a profile may set and the accepted JSON types
+number = (int, float)
+allowed_options = {
+    "language": (str,),
+    "task": (str,),
+    "temperature": (int, float, list),
+    "beam_size": (int,),
+    "best_of": (int,),
+    "patience": number,
+    "length_penalty": number,
+    "condition_on_previous_text": (bool,),
+    "initial_prompt": (str,),
+    "compression_ratio_threshold": number,
+    "logprob_threshold": number,
+    "no_speech_threshold": number,
+    "fp16": (bool,),
+}
+
+
+def compile_profiles(definitions):
+    """
+        Merges the profile definitions of targets.json with the built in
+        profiles and resolves the "base" references. Returns a dictionary of
+        profile name -> transcribe() options, raises ValueError if a
+        definition is not valid.
+    """
+    if not isinstance(definitions, dict):
+        raise ValueError("profiles must be a JSON object")
+    for name, definition in definitions.items():
+        if not isinstance(definition, dict):
+            raise ValueError(f"profile '{name}' must be a JSON object")
+        for option, value in definition.items():
+            if option == "base":
+                if not isinstance(value, str):
+                    raise ValueError(f"profile '{name}': base must be a string")
+                continue
+            if option not in allowed_options:
+                raise ValueError(f"profile '{name}': unknown option '{option}'")
+            # null resets the option to the library default
+            if value is None:
+                continue
+            types = allowed_options[option]
+            if isinstance(value, bool) and bool not in types:
+                raise ValueError(f"profile '{name}': invalid {option} {value}")
+            if not isinstance(value, types):
+                raise ValueError(f"profile '{name}': invalid {option} {value}")
+            if isinstance(value, list) and not all(
+                    isinstance(item, number) and not isinstance(item, bool)
+                    for item in value):
+                raise ValueError(f"profile '{name}': invalid {option} {value}")
+
+    compiled = {}
+
+    def resolve(name, seen):
+        if name in compiled:
+            return compiled[name]
+        if name in seen:
+            raise ValueError(f"profile '{name}' is based on itself")
+        if name in definitions:
+            definition = dict(definitions[name])
+            # without a base a built in profile is extended, a new one
+            # starts from the library defaults
+            base = definition.pop("base", name)
+            if base == name:
+                options = copy.deepcopy(builtin_profiles.get(name, {}))
+            elif base in definitions or base in builtin_profiles:
+                options = dict(resolve(base, seen | {name}))
+            else:
+                raise ValueError(f"profile '{name}' is based on unknown "
+                                 + f"profile '{base}'")
+            options.update(definition)
+        elif name in builtin_profiles:
+            options = copy.deepcopy(builtin_profiles[name])
+        else:
+            raise ValueError(f"unknown profile '{name}'")
+        options = {key: value for key, value in options.items()
+                   if value is not None}
+        compiled[name] = options
+        return options
+
+    for name in list(builtin_profiles) + list(definitions):
+        resolve(name, frozenset())
+    return compiled
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+#
+# Opt-in per-file profiling
+#
+# Writes one JSON record per handled file: wall and CPU time per stage (the
+# stages of metrics.py), audio duration, real-time factor, the number of 30
+# second windows decoded and the temperature fallbacks hit. Files slower than
+# a threshold can also leave a cProfile (and optionally torch profiler) dump
+# behind, so slow outliers can be looked at afterwards.
+#
+# The stages nest: "file" holds everything, "output" holds "routing",
+# "file_move" and "smtp".
+#
+# The profilers can't run for several files at once (the torch profiler, and
+# cProfile from Python 3.12 on, allow one session per process). With parallel
+# workers the dumps are made of one file at a time, the files handled
+# meanwhile get their record without dumps.
+
+import contextlib
+import cProfile
+import json
+import os
+import threading
+import time
+
+import metrics
+
+# the profiler of the process, None when profiling is off
+active = None
+
+
+class Profiler:
+
+    def __init__(self, path, slow_seconds = None, dump_folder = None,
+                 torch_profiler = False):
+        self.path = path
+        self.slow_seconds = slow_seconds
+        self.dump_folder = dump_folder or os.path.dirname(os.path.abspath(path))
+        self.torch_profiler = torch_profiler
+        self.lock = threading.Lock()
+        # held by the file being dumped
+        self.dump_lock = threading.Lock()
+        self.local = threading.local()
+        metrics.stage_hooks.append(self.record_stage)
+
+    def current(self):
+        return getattr(self.local, "trace", None)
+
+    def record_stage(self, name, wall, cpu):
+        trace = self.current()
+        if trace is None:
+            return
+        stage = trace["stages"].setdefault(name, {"wall_seconds": 0.0,
+                                                  "cpu_seconds": 0.0})
+        stage["wall_seconds"] += wall
+        stage["cpu_seconds"] += cpu
+
+    def __start_dumps(self):
+        """ Profilers which only get saved if the file turns out slow. """
+        if self.slow_seconds is None \
+                or not self.dump_lock.acquire(blocking = False):
+            return None, None
+        try:
+            python_profile = cProfile.Profile()
+            torch_profile = None
+            if self.torch_profiler:
+                import torch
+                torch_profile = torch.profiler.profile(
+                    activities = [torch.profiler.ProfilerActivity.CPU])
+                torch_profile.__enter__()
+            python_profile.enable()
+        except BaseException:
+            self.dump_lock.release()
+            raise
+        return python_profile, torch_profile
+
+    def __save_dumps(self, trace, python_profile, torch_profile):
+        if python_profile is None:
+            return
+        try:
+            python_profile.disable()
+            if torch_profile is not None:
+                torch_profile.__exit__(None, None, None)
+        finally:
+            self.dump_lock.release()
+        if trace["wall_seconds"] < self.slow_seconds:
+            return
+        os.makedirs(self.dump_folder, exist_ok = True)
+        base = os.path.join(self.dump_folder,
+                            os.path.basename(trace["file"]) + "-"
+                            + time.strftime("%Y%m%d-%H%M%S"))
+        python_profile.dump_stats(base + ".prof")
+        trace["dumps"] = [base + ".prof"]
+        if torch_profile is not None:
+            torch_profile.export_chrome_trace(base + ".torch.json")
+            trace["dumps"].append(base + ".torch.json")
+
+    @contextlib.contextmanager
+    def file(self, path):
+        """ Traces the handling of one file, the with block does the work. """
+        trace = {
+            "file": path,
+            "started": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "wall_seconds": 0.0,
+            "cpu_seconds": 0.0,
+            "audio_seconds": None,
+            "rtf": None,
+            "windows": 0,
+            "fallbacks": 0,
+            "target": None,
+            "outcome": None,
+            "stages": {},
+            "dumps": [],
+            "error": None,
+        }
+        self.local.trace = trace
+        python_profile, torch_profile = self.__start_dumps()
+        start, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield trace
+        except Exception as e:
+            trace["error"] = repr(e)
+            raise
+        finally:
+            trace["wall_seconds"] = time.perf_counter() - start
+            trace["cpu_seconds"] = time.process_time() - cpu
+            self.local.trace = None
+            if trace["audio_seconds"]:
+                trace["rtf"] = trace["wall_seconds"] / trace["audio_seconds"]
+            try:
+                self.__save_dumps(trace, python_profile, torch_profile)
+            except Exception as e:
+                print(f"WARNING: could not save profile of {path}: {e}")
+            with self.lock:
+                with open(self.path, "a") as f:
+                    f.write(json.dumps(trace) + "\n")
+
+
+def start(path, slow_seconds = None, dump_folder = None,
+          torch_profiler = False):
+    """ Turns per-file profiling on for the process. """
+    global active
+    active = Profiler(path, slow_seconds, dump_folder, torch_profiler)
+    return active
+
+
+def trace_file(path):
+    """ Context manager tracing one file, does nothing when profiling is off. """
+    if active is None:
+        return contextlib.nullcontext()
+    return active.file(path)
+
+
+def annotate(add = False, **values):
+    """
+        Sets (or with add=True adds to) values of the record of the file
+        being handled, nothing happens when profiling is off.
+    """
+    trace = active.current() if active else None
+    if trace is None:
+        return
+    for key, value in values.items():
+        trace[key] = trace[key] + value if add else value
+
+
+# whisper decodes 30 second windows of 3000 mel frames of 10 ms, segments
+# carry the frame their window started at as "seek"
+frames_per_second = 100
+window_frames = 3000
+
+
+def decode_stats(result, options, start = 0.0, end = None):
+    """
+        Number of 30 second windows decoded between start and end (seconds,
+        end None for the end of the last segment) and of windows which
+        needed a temperature fallback, from a transcribe() result.
+
+        Windows which gave no segments (e.g. skipped as silence) leave no
+        trace in the result, they are counted from the gaps between the
+        windows which did.
+    """
+    temperature = options.get("temperature", 0.0)
+    first = temperature if isinstance(temperature, (int, float)) \
+        else temperature[0]
+    seeks, fallbacks = set(), set()
+    last_end = start
+    for segment in result.get("segments", []):
+        seeks.add(segment.get("seek", 0))
+        last_end = max(last_end, segment.get("end", 0.0))
+        if segment.get("temperature", first) > first:
+            fallbacks.add(segment.get("seek"))
+    first_frame = int(start * frames_per_second)
+    end_frame = int((last_end if end is None else end) * frames_per_second)
+
+    windows = len(seeks)
+    # a window covers at most window_frames, longer stretches without
+    # output were windows of their own
+    covered = first_frame
+    for seek in sorted(seeks):
+        windows += -(-max(0, seek - covered) // window_frames)
+        covered = seek + window_frames
+    windows += -(-max(0, end_frame - max(covered, first_frame))
+                 // window_frames)
+    return windows, len(fallbacks)
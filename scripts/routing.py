@@ -0,0 +1,231 @@
+#!/usr/bin/env python3
+#
+# Routing index for the magic words defined in targets.json
+#
+# The targets file is compiled once into a lookup index which folds case and
+# diacritics, knows the aliases and multi-word phrases of every target and can
+# match common mis-transcriptions of the magic words. The index is rebuilt
+# whenever the file on disk changes, the old index stays in use until the new
+# one has been fully built.
+
+import json
+import os
+import difflib
+import unicodedata
+from collections import namedtuple
+import profiles
+
+# Keys in targets.json which are not routing targets
+reserved_keys = ['profiles']
+
+# Similarity (0..1) which a fuzzy match needs to reach, see difflib
+default_fuzzy_cutoff = 0.88
+
+Route = namedtuple('Route', ['target', 'details', 'matched', 'fuzzy'])
+
+
+class ConfigError(Exception):
+    """Raised when targets.json can't be loaded or is not valid."""
+
+
+def normalize(text):
+    """
+        Splits the text into words which are lowercased and have their
+        diacritics and punctuation removed, "Äänitä, kiitos!" becomes
+        ['aanita', 'kiitos'].
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = text.casefold()
+    words = []
+    for word in text.split():
+        word = "".join(c for c in word if c.isalnum())
+        if word:
+            words.append(word)
+    return words
+
+
+def validate(config):
+    """
+        Sanity checks the loaded targets.json content. Raises ConfigError
+        describing the first problem found, returns the compiled decoding
+        profiles.
+    """
+    if not isinstance(config, dict):
+        raise ConfigError("targets definition must be a JSON object")
+    if 'default' not in config:
+        raise ConfigError("key default not found in targets definition")
+    try:
+        compiled = profiles.compile_profiles(config.get('profiles', {}))
+    except ValueError as e:
+        raise ConfigError(e)
+    for name, details in config.items():
+        if name in reserved_keys:
+            continue
+        if not isinstance(details, dict):
+            raise ConfigError(f"target '{name}' must be a JSON object")
+        if 'transcript' not in details:
+            raise ConfigError(f"target '{name}' has no transcript definition")
+        aliases = details.get('aliases', [])
+        if not isinstance(aliases, list) or \
+                not all(isinstance(alias, str) for alias in aliases):
+            raise ConfigError(f"aliases of target '{name}' must be a list "
+                              + "of strings")
+        if 'profile' in details and not isinstance(details['profile'], str):
+            raise ConfigError(f"profile of target '{name}' must be a string")
+        if 'profile' in details and details['profile'] not in compiled:
+            raise ConfigError(f"target '{name}' uses unknown profile "
+                              + f"'{details['profile']}'")
+        fuzzy = details.get('fuzzy', True)
+        if isinstance(fuzzy, bool):
+            continue
+        if not isinstance(fuzzy, (int, float)) or not 0 < fuzzy <= 1:
+            raise ConfigError(f"fuzzy of target '{name}' must be true, "
+                              + "false or a number between 0 and 1")
+    return compiled
+
+
+class RoutingIndex:
+    """
+        Compiled form of targets.json. Every target name and alias is
+        normalized into a phrase (tuple of words), the transcript is matched
+        against the phrases starting from its first word.
+    """
+
+    def __init__(self, config, fuzzy_cutoff = default_fuzzy_cutoff):
+        # name -> transcribe() options of the decoding profiles
+        self.profiles = validate(config)
+        self.config = config
+        self.fuzzy_cutoff = fuzzy_cutoff
+        self.phrases = {}
+        # phrase length -> {joined phrase: (target, cutoff)}
+        self.fuzzy_phrases = {}
+        self.max_words = 0
+
+        for name, details in config.items():
+            if name == 'default' or name in reserved_keys:
+                continue
+            for key in [name] + details.get('aliases', []):
+                phrase = tuple(normalize(key))
+                if not phrase:
+                    print(f"WARNING: magic word '{key}' of target '{name}' "
+                          + "is empty once normalized, ignoring it")
+                    continue
+                if phrase in self.phrases:
+                    if self.phrases[phrase] != name:
+                        print(f"WARNING: magic word '{key}' of target "
+                              + f"'{name}' is already used by target "
+                              + f"'{self.phrases[phrase]}', ignoring it")
+                    continue
+                self.phrases[phrase] = name
+                self.max_words = max(self.max_words, len(phrase))
+
+                fuzzy = details.get('fuzzy', True)
+                if fuzzy is False:
+                    continue
+                cutoff = fuzzy_cutoff if fuzzy is True else fuzzy
+                self.fuzzy_phrases.setdefault(len(phrase), {})[
+                    " ".join(phrase)] = (name, cutoff)
+
+    def lookup(self, text, fallback = 'default'):
+        """
+            Finds the target of the transcript. Exact matches win over fuzzy
+            ones and longer phrases win over shorter ones. If nothing matches
+            the fallback target is returned.
+        """
+        words = normalize(text)
+        longest = min(self.max_words, len(words))
+
+        for length in range(longest, 0, -1):
+            phrase = tuple(words[:length])
+            if phrase in self.phrases:
+                name = self.phrases[phrase]
+                return Route(name, self.config[name], " ".join(phrase), False)
+
+        for length in range(longest, 0, -1):
+            candidates = self.fuzzy_phrases.get(length)
+            if not candidates:
+                continue
+            spoken = " ".join(words[:length])
+            best = None
+            for match, (name, cutoff) in candidates.items():
+                ratio = difflib.SequenceMatcher(None, spoken, match).ratio()
+                if ratio >= cutoff and (best is None or ratio > best[0]):
+                    best = (ratio, name, match)
+            if best:
+                return Route(best[1], self.config[best[1]], best[2], True)
+
+        # the fallback of a folder may be gone from a reloaded file
+        if fallback not in self.config:
+            fallback = 'default'
+        return Route(fallback, self.config[fallback], None, False)
+
+    def profile_of(self, target, default = 'default'):
+        """ Name of the decoding profile used for the target. """
+        return self.config[target].get('profile', default)
+
+    def uses_profiles(self, default = 'default'):
+        """
+            True if some target decodes with another profile than the
+            default one, only then the target needs to be known before the
+            full transcription.
+        """
+        return any(self.profile_of(name, default) != default
+                   for name in self.config if name not in reserved_keys)
+
+
+class TargetsFile:
+    """
+        targets.json on disk. reload_if_changed() rebuilds the index when the
+        modification time or size of the file changes, a broken file is
+        reported and the previous index is kept.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.index = None
+        self.stamp = None
+
+    @property
+    def config(self):
+        return self.index.config
+
+    def __stamp(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        """ Loads and compiles the file, raises ConfigError on failure. """
+        try:
+            stamp = self.__stamp()
+            with open(self.path) as f:
+                config = json.load(f)
+        except (OSError, ValueError) as e:
+            raise ConfigError(f"{self.path}: {e}")
+        # single assignment, lookups see either the old or the new index
+        self.index = RoutingIndex(config)
+        self.stamp = stamp
+        return self.index
+
+    def reload_if_changed(self):
+        """ Returns True if a new index was taken into use. """
+        try:
+            stamp = self.__stamp()
+        except OSError as e:
+            if self.stamp is not None:
+                print(f"WARNING: can't read {self.path}, keeping old "
+                      + f"targets: {e}")
+                self.stamp = None
+            return False
+        if stamp == self.stamp:
+            return False
+        try:
+            self.load()
+        except ConfigError as e:
+            # remember the broken version so the warning isn't repeated
+            self.stamp = stamp
+            print(f"WARNING: not reloading {self.path}, keeping old "
+                  + f"targets: {e}")
+            return False
+        print(f"Reloaded targets from {self.path}")
+        return True
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+#
+# Fair-share scheduling of the workers between the monitored folders
+#
+# Every folder is charged the worker time its files take, divided by its
+# weight. The next file is taken from the folder with the least charged time,
+# so a folder with a long queue gets its turn after every other busy folder
+# has had theirs, and a folder with weight 2 gets twice the worker time of a
+# folder with weight 1. A file is charged the average time of the folder when
+# it is handed out and corrected once it is done, so parallel workers don't
+# all pick the same folder.
+#
+# A folder which was idle starts from the charge of the folders being served,
+# it doesn't get to spend the time it saved up while it had nothing to do.
+
+import os
+import threading
+from collections import namedtuple
+
+# weight of the latest file in the average time per file of a folder
+average_weight = 0.2
+
+Claim = namedtuple('Claim', ['share', 'item', 'estimate'])
+
+
+class Share:
+    """ A monitored folder (inbox.Source) and its inbox.Inbox. """
+
+    def __init__(self, source, box):
+        self.source = source
+        self.box = box
+        # worker seconds used divided by the weight
+        self.charged = 0.0
+        # average worker seconds per file
+        self.average = 1.0
+        self.busy = 0
+        self.active = False
+
+
+class FairShare:
+    """ Hands out the ready files of the folders to the workers. """
+
+    def __init__(self, shares):
+        self.shares = shares
+        self.lock = threading.Lock()
+        # paths of the files being handled
+        self.claimed = set()
+        # charge of the folder served last, where idle folders start from
+        self.virtual_time = 0.0
+
+    def claim(self):
+        """ The next file to handle as a Claim, None if nothing is ready. """
+        with self.lock:
+            candidates = []
+            for order, share in enumerate(self.shares):
+                ready = [item for item in share.box.ready_files()
+                         if os.path.join(item.folder, item.filename)
+                         not in self.claimed]
+                if not ready and not share.busy:
+                    share.active = False
+                    continue
+                if not share.active:
+                    share.charged = max(share.charged, self.virtual_time)
+                    share.active = True
+                if ready:
+                    candidates.append((share.charged, order, share, ready[0]))
+            if not candidates:
+                return None
+            charged, _, share, item = min(candidates)
+            self.virtual_time = charged
+            share.charged += share.average / share.source.weight
+            share.busy += 1
+            self.claimed.add(os.path.join(item.folder, item.filename))
+            return Claim(share, item, share.average)
+
+    def release(self, claim, seconds, failed = False):
+        """ The file of the claim took seconds of worker time. """
+        share = claim.share
+        with self.lock:
+            self.claimed.discard(os.path.join(claim.item.folder,
+                                              claim.item.filename))
+            share.busy -= 1
+            share.charged += (seconds - claim.estimate) / share.source.weight
+            share.average += average_weight * (seconds - share.average)
+            if failed:
+                share.box.failed(claim.item)
+
+    def growing_files(self):
+        """ Files still being written in any of the folders. """
+        with self.lock:
+            return [item for share in self.shares
+                    for item in share.box.growing_files()]
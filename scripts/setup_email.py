@@ -124,8 +124,9 @@ def validate_smtp_connection(smtp_server, smtp_port):
         print(f"An unexpected error occurred during SMTP validation: {e}")
     return False
 
-def validate_email_config_data(config_data):
-    """Validates the structure and content of loaded email configuration data."""
+def validate_email_config_data(config_data, test_connection=True):
+    """Validates the structure and content of loaded email configuration data.
+    The SMTP connection test can be skipped with test_connection=False."""
     print("\nValidating email.json content...")
     valid = True
     required_keys = ["smtp_server", "smtp_port", "sender_email"]
@@ -154,7 +155,7 @@ def validate_email_config_data(config_data):
         return False
 
     # If structure is okay, try SMTP connection
-    if not validate_smtp_connection(config_data["smtp_server"], config_data["smtp_port"]):
+    if test_connection and not validate_smtp_connection(config_data["smtp_server"], config_data["smtp_port"]):
         valid = False
 
     return valid
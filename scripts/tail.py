@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+#
+# Transcription of WAV files while they are still being uploaded
+#
+# A WAV file is a header followed by raw samples, so the part of the file
+# already written can be read while the rest is still arriving. Finished 30
+# second windows are transcribed right away, once the upload is complete only
+# the last window is left. While a file is growing its header usually has a
+# placeholder data size (0 or 0xFFFFFFFF), the amount of audio is then taken
+# from the file size. Otherwise the data size is used, so chunks after the
+# samples (LIST, id3 metadata) aren't read as audio.
+
+import os
+import struct
+import threading
+
+# whisper works with 16 kHz mono float samples
+sample_rate = 16000
+window_seconds = 30
+# a segment ending closer than this to the window end may be cut mid-word
+segment_margin = 1.0
+
+# WAVE_FORMAT_PCM, WAVE_FORMAT_IEEE_FLOAT, WAVE_FORMAT_EXTENSIBLE
+format_pcm, format_float, format_extensible = 1, 3, 0xFFFE
+
+
+class WavError(Exception):
+    """ The file is not (yet) a WAV file tail mode can read. """
+
+
+class WavReader:
+    """ Reads sample ranges of a WAV file which may still be growing. """
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            header = f.read(4096)
+        if len(header) < 12 or header[:4] != b"RIFF" or header[8:12] != b"WAVE":
+            raise WavError(f"{path} is not a WAV file")
+        self.format = None
+        self.data_offset = None
+        # None while the header has a placeholder
+        self.data_size = None
+        position = 12
+        while position + 8 <= len(header):
+            chunk, size = struct.unpack("<4sI", header[position:position + 8])
+            if chunk == b"fmt ":
+                if position + 24 > len(header):
+                    break
+                (tag, self.channels, self.rate, _, _,
+                 self.bits) = struct.unpack("<HHIIHH",
+                                            header[position + 8:position + 24])
+                if tag == format_extensible and position + 34 <= len(header):
+                    tag = struct.unpack("<H", header[position + 32:
+                                                     position + 34])[0]
+                self.format = tag
+            elif chunk == b"data":
+                self.data_offset = position + 8
+                if size not in (0, 0xFFFFFFFF):
+                    self.data_size = size
+                break
+            position += 8 + size + (size & 1)
+        if self.format is None or self.data_offset is None:
+            raise WavError(f"{path}: header not complete yet")
+        if (self.format, self.bits) not in ((format_pcm, 16), (format_pcm, 32),
+                                            (format_float, 32)):
+            raise WavError(f"{path}: {self.bits} bit format {self.format} "
+                           + "is not supported in tail mode")
+        self.frame_size = self.channels * self.bits // 8
+
+    def data_length(self):
+        """ Bytes of samples written so far. """
+        written = os.path.getsize(self.path) - self.data_offset
+        if self.data_size is not None:
+            written = min(written, self.data_size)
+        return max(0, written)
+
+    def duration(self):
+        """ Seconds of complete frames written so far. """
+        return self.data_length() // self.frame_size / self.rate
+
+    def read(self, start, end = None):
+        """ Raw sample bytes between the two times (seconds). """
+        first = int(start * self.rate) * self.frame_size
+        last = self.data_length()
+        if end is not None:
+            last = min(last, int(end * self.rate) * self.frame_size)
+        with open(self.path, "rb") as f:
+            f.seek(self.data_offset + first)
+            data = f.read(max(0, last - first))
+        return data[:len(data) - len(data) % self.frame_size]
+
+    def samples(self, start, end = None):
+        """ The range as 16 kHz mono float32 samples, the way whisper wants. """
+        import numpy as np
+        data = self.read(start, end)
+        if self.format == format_float:
+            audio = np.frombuffer(data, "<f4").astype(np.float32)
+        elif self.bits == 16:
+            audio = np.frombuffer(data, "<i2").astype(np.float32) / 32768.0
+        else:
+            audio = np.frombuffer(data, "<i4").astype(np.float32) / 2147483648.0
+        audio = audio.reshape(-1, self.channels).mean(axis = 1)
+        if self.rate != sample_rate and len(audio):
+            count = int(len(audio) * sample_rate / self.rate)
+            audio = np.interp(np.arange(count) * self.rate / sample_rate,
+                              np.arange(len(audio)), audio)
+        return audio.astype(np.float32)
+
+
+class TailState:
+    """ Progress of one growing WAV file. """
+
+    def __init__(self, path, model_size = None):
+        self.path = path
+        self.model_size = model_size
+        self.offset = 0.0
+        self.text = ""
+        self.language = None
+        self.reader = None
+        self.unsupported = False
+
+    def __transcribe(self, AI, audio):
+        result = AI.transcribe_window(audio, prompt = self.text,
+                                      language = self.language,
+                                      model_size = self.model_size)
+        self.language = self.language or result.get("language")
+        return result
+
+    def advance(self, AI):
+        """
+            Transcribes the next complete window if the file has one.
+            Returns True if a window was transcribed.
+        """
+        if self.unsupported:
+            return False
+        try:
+            if self.reader is None:
+                self.reader = WavReader(self.path)
+        except WavError as e:
+            if "not complete" not in str(e):
+                print(f"Tail mode: {e}")
+                self.unsupported = True
+            return False
+        if self.reader.duration() - self.offset < window_seconds:
+            return False
+
+        result = self.__transcribe(AI, self.reader.samples(
+            self.offset, self.offset + window_seconds))
+        # keep the segments which surely ended inside the window, the next
+        # window starts from where the last of them ended
+        segments = [segment for segment in result["segments"]
+                    if segment["end"] <= window_seconds - segment_margin]
+        if segments:
+            self.text += "".join(segment["text"] for segment in segments)
+            self.offset += segments[-1]["end"]
+        else:
+            self.text += result["text"]
+            self.offset += window_seconds
+        print(f"Tail mode: {os.path.basename(self.path)} transcribed up to "
+              + f"{self.offset:.1f} s")
+        return True
+
+    def finish(self, AI):
+        """ Transcribes what is left once the file is complete. """
+        # the header may have been rewritten at the end of the upload
+        self.reader = WavReader(self.path)
+        if self.reader.duration() > self.offset:
+            self.text += self.__transcribe(
+                AI, self.reader.samples(self.offset))["text"]
+        return self.text
+
+
+class TailTranscriptions:
+    """
+        TailState of every growing WAV file of the monitored folders. models
+        maps a folder to the model size of its files, None for the default.
+    """
+
+    def __init__(self, models = None):
+        self.states = {}
+        self.models = models or {}
+        # one worker advances the windows, finish() waits for it
+        self.lock = threading.Lock()
+
+    def advance(self, AI, growing):
+        """ Transcribes one window of one growing WAV file, True if done. """
+        if not self.lock.acquire(blocking = False):
+            return False
+        try:
+            items = [item for item in growing
+                     if item.filename.lower().endswith(".wav")]
+            paths = [item.folder + "/" + item.filename for item in items]
+            # forget files which were removed mid-upload
+            for path in list(self.states):
+                if path not in paths and not os.path.exists(path):
+                    del self.states[path]
+            for item, path in zip(items, paths):
+                if path not in self.states:
+                    self.states[path] = TailState(
+                        path, self.models.get(item.folder))
+                try:
+                    if self.states[path].advance(AI):
+                        return True
+                except Exception as e:
+                    # removed or renamed mid-upload, or the inference
+                    # failed: the file is transcribed once it is complete
+                    print(f"Tail mode: {item.filename}: {e}")
+                    self.states[path].unsupported = True
+                    return False
+            return False
+        finally:
+            self.lock.release()
+
+    def finish(self, AI, path):
+        """
+            Text of a file transcribed in tail mode, None if the file was not
+            (or could not be) transcribed while it was growing.
+        """
+        with self.lock:
+            state = self.states.pop(path, None)
+        if state is None or state.offset == 0 or state.unsupported:
+            return None
+        try:
+            return state.finish(AI)
+        except WavError as e:
+            print(f"Tail mode: {e}, transcribing the whole file")
+            return None
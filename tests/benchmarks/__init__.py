@@ -0,0 +1,6 @@
+# This file makes Python treat the `tests/benchmarks` directory as a package.
+import os
+import sys
+
+# The benchmarks import each other as top level modules
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'benchmarks'))
@@ -0,0 +1,27 @@
+import sys
+import tempfile
+import unittest
+import stress
+
+
+class TestStressHarness(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_every_route_is_correct(self):
+        results = stress.run_stress(stress.sample_targets, 60,
+                                    self.tmpdir.name)
+        self.assertEqual(results["files"], 60)
+        self.assertEqual(results["failures"], [])
+        self.assertEqual(set(results["routes"]),
+                         set(stress.sample_targets))
+        self.assertEqual(results["stages"]["transcribe"]["count"], 60)
+        self.assertNotIn("whisper", sys.modules)
+
+    def test_email_targets_fall_back_without_mail_server(self):
+        results = stress.run_stress(stress.sample_targets, 30,
+                                    self.tmpdir.name, email = False)
+        self.assertEqual(results["failures"], [])
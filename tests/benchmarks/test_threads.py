@@ -0,0 +1,28 @@
+import unittest
+import cpu
+import threads
+
+
+def topology(cpus, cores, quota = None):
+    return cpu.Topology(list(range(cpus)),
+                        [cpu.Core(0, 0, core, (core,)) for core in range(cores)],
+                        quota)
+
+
+class TestThreadSweep(unittest.TestCase):
+    def test_sweep_counts(self):
+        self.assertEqual(threads.sweep_counts(topology(16, 8)),
+                         [1, 2, 4, 8, 16])
+        self.assertEqual(threads.sweep_counts(topology(12, 6, 3.0)),
+                         [1, 2, 3, 4, 8, 12])
+        self.assertEqual(threads.sweep_counts(topology(1, 1)), [1])
+        self.assertEqual(threads.sweep_counts(topology(12, 6), 2),
+                         [1, 2, 3, 4, 8, 12])
+
+    def test_table_marks_default_and_fastest(self):
+        runs = [{"threads": count, "rtf": rtf, "p50_seconds": 1.0,
+                 "p95_seconds": 2.0}
+                for count, rtf in ((2, 0.5), (4, 0.3), (8, 0.35))]
+        lines = threads.format_table(runs, 8)
+        self.assertTrue(lines[2].endswith("fastest"))
+        self.assertTrue(lines[3].endswith("default"))
@@ -0,0 +1,52 @@
+import io
+import json
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+import throughput
+
+
+def run(model, rtf, rss):
+    return {"model": model, "profile": "default", "rtf": rtf,
+            "p95_seconds": 1.0, "load_seconds": 2.0, "peak_rss_mb": rss}
+
+
+class TestCompare(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def compare(self, old, new, *options):
+        paths = []
+        for name, runs in (("old.json", old), ("new.json", new)):
+            paths.append(os.path.join(self.tmpdir.name, name))
+            with open(paths[-1], "w") as f:
+                json.dump({"runs": runs}, f)
+        output = io.StringIO()
+        with redirect_stdout(output):
+            code = throughput.main(["throughput.py", "compare"] + paths
+                                   + list(options))
+        return code, output.getvalue()
+
+    def test_no_regression(self):
+        code, output = self.compare([run("small", 0.5, 900)],
+                                    [run("small", 0.52, 880)])
+        self.assertEqual(code, 0)
+
+    def test_regression(self):
+        code, output = self.compare([run("small", 0.5, 900)],
+                                    [run("small", 0.6, 900)])
+        self.assertEqual(code, 1)
+        self.assertIn("+20.0%!", output)
+        code, output = self.compare([run("small", 0.5, 900)],
+                                    [run("small", 0.6, 900)],
+                                    "--threshold", "25")
+        self.assertEqual(code, 0)
+
+    def test_unmatched_runs(self):
+        code, output = self.compare([run("small", 0.5, 900)],
+                                    [run("tiny", 0.1, 300)])
+        self.assertIn("small      default      only in old results", output)
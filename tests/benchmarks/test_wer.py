@@ -0,0 +1,16 @@
+import unittest
+from wer import word_errors, word_error_rate
+
+
+class TestWordErrors(unittest.TestCase):
+    def test_identical_after_normalization(self):
+        self.assertEqual(word_errors("Osta maitoa.", "osta, MAITOA"), (0, 2))
+
+    def test_substitution_deletion_insertion(self):
+        self.assertEqual(word_errors("a b c d", "a x c"), (2, 4))
+        self.assertEqual(word_errors("a b", "a b c"), (1, 2))
+
+    def test_rate(self):
+        self.assertEqual(word_error_rate("one two three four", "one two"), 0.5)
+        self.assertEqual(word_error_rate("", ""), 0.0)
+        self.assertEqual(word_error_rate("", "noise"), 1.0)
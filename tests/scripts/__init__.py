@@ -1 +1,7 @@
 # This file makes Python treat the `tests/scripts` directory as a package.
+import os
+import sys
+
+# The scripts import each other as top level modules, the same way they are
+# run from /app in the container
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', '..', 'scripts'))
@@ -0,0 +1,295 @@
+import io
+import json
+import os
+import sys
+import tempfile
+import threading
+import types
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+import LLM_text_to_speech as stt
+
+TARGETS = {
+    "default": {"keepaudiofile": False, "transcript": "inbox"},
+    "kauppa": {"keepaudiofile": False, "transcript": "notes",
+               "aliases": ["shopping list"]},
+}
+
+
+class CommandTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.targets = os.path.join(self.tmpdir.name, "targets.json")
+        self.email = os.path.join(self.tmpdir.name, "email.json")
+        self.audio = os.path.join(self.tmpdir.name, "audio")
+        os.mkdir(self.audio)
+        self.write(self.targets, TARGETS)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, path, content):
+        with open(path, "w") as f:
+            f.write(content if isinstance(content, str)
+                    else json.dumps(content))
+
+    def run_command(self, *arguments):
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit) as e:
+            stt.main(["LLM_text_to_speech.py", "-t", self.targets,
+                      "-e", self.email, "-f", self.audio] + list(arguments))
+        return e.exception.code, output.getvalue()
+
+
+class FakeModel:
+    """ Records the transcribe() calls, answers with scripted results. """
+
+    class device:
+        type = "cpu"
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.calls = []
+
+    def transcribe(self, audio, **options):
+        self.calls.append(options)
+        return self.results.pop(0)
+
+
+class TranscriberTestCase(CommandTestCase):
+    """ A transciber with a fake model, no model is loaded. """
+
+    def setUp(self):
+        super().setUp()
+        self.fake_whisper = types.SimpleNamespace(
+            load_audio = lambda path: [0.0] * 16000 * 60)
+
+    def transciber(self, targets, results):
+        self.write(self.targets, targets)
+        AI = object.__new__(stt.transciber)
+        AI.debuginfo = False
+        AI.profile = "default"
+        AI.targets_file = self.targets
+        AI.email_file = self.email
+        AI.model_size = "medium"
+        self.model = FakeModel(results)
+        AI.models = {"medium": (self.model, threading.Lock())}
+        AI.runners = {}
+        AI.output_lock = threading.Lock()
+        with redirect_stdout(io.StringIO()):
+            AI.load_config()
+        return AI
+
+
+class TestModelFreeCommands(CommandTestCase):
+    def test_whisper_is_not_imported(self):
+        self.run_command("check-config")
+        self.assertNotIn("whisper", sys.modules)
+
+    def test_check_config_ok(self):
+        self.write(self.email, {"smtp_server": "smtp.example.com",
+                                "smtp_port": 587,
+                                "sender_email": "noreply@example.com"})
+        code, output = self.run_command("check-config")
+        self.assertEqual(code, 0)
+        self.assertIn("shopping list -> kauppa", output)
+
+    def test_check_config_broken_targets(self):
+        self.write(self.targets, {"kauppa": {"transcript": "notes"}})
+        code, output = self.run_command("check-config")
+        self.assertEqual(code, 1)
+        self.assertIn("key default not found", output)
+
+    def test_check_config_broken_email(self):
+        self.write(self.email, {"smtp_server": "smtp.example.com"})
+        code, output = self.run_command("check-config")
+        self.assertEqual(code, 1)
+
+    def test_route(self):
+        code, output = self.run_command("route", "Shopping list: milk")
+        self.assertEqual(code, 0)
+        self.assertIn("Target: kauppa", output)
+
+    def test_missing_targets_file(self):
+        os.remove(self.targets)
+        code, output = self.run_command("route", "text")
+        self.assertEqual(code, 1)
+        self.assertIn("not found", output)
+
+    def test_queue_status(self):
+        for filename in ["a.wav", "b.m4a", "notes.txt"]:
+            self.write(os.path.join(self.audio, filename), "1234")
+        code, output = self.run_command("queue-status", "--json")
+        self.assertEqual(code, 0)
+        status = json.loads(output)
+        self.assertEqual(status["files"], 2)
+        self.assertEqual(status["bytes"], 8)
+
+
+    def test_queue_status_of_several_folders(self):
+        other = os.path.join(self.tmpdir.name, "other")
+        os.mkdir(other)
+        self.write(os.path.join(other, "a.mp3"), "1234")
+        code, output = self.run_command("-f", other + ",weight=2",
+                                        "queue-status", "--json")
+        self.assertEqual(code, 0)
+        self.assertEqual([json.loads(line)["files"]
+                          for line in output.splitlines()], [0, 1])
+
+    def test_same_folder_twice(self):
+        code, output = self.run_command("-f", self.audio + ",target=kauppa",
+                                        "queue-status")
+        self.assertEqual(code, 1)
+        self.assertIn("more than once", output)
+
+    def test_profile_options_need_profile(self):
+        for option in (["--profile-slow", "0"], ["--profile-dumps", "dumps"],
+                       ["--profile-torch"]):
+            with self.subTest(option=option[0]):
+                code, output = self.run_command(*option, "queue-status")
+                self.assertEqual(code, 1)
+                self.assertIn(option[0] + " needs --profile", output)
+
+    def test_one_workers_option(self):
+        def workers(*arguments):
+            return stt.init(["LLM_text_to_speech.py", "-t", self.targets]
+                            + list(arguments)).workers
+        self.assertEqual(workers(), 2)
+        self.assertEqual(workers("--workers", "4", "batch", "/archive"), 4)
+        self.assertEqual(workers("batch", "/archive", "-w", "3"), 3)
+        self.assertEqual(workers("batch", "/archive"), 2)
+
+    def test_check_config_unknown_folder_target(self):
+        other = os.path.join(self.tmpdir.name, "other")
+        code, output = self.run_command("-f", other + ",target=anna",
+                                        "check-config")
+        self.assertEqual(code, 1)
+        self.assertIn("Unknown target anna of folder", output)
+
+
+class TestCpuSettings(CommandTestCase):
+    def settings(self, *arguments):
+        args = stt.init(["LLM_text_to_speech.py", "-t", self.targets,
+                         "-f", self.audio] + list(arguments))
+        topology = stt.cpu.Topology(list(range(8)), [
+            stt.cpu.Core(0, 0, core, (core,)) for core in range(8)], None)
+        with patch.object(stt.cpu, "detect", lambda: topology), \
+                patch.dict(os.environ), redirect_stdout(io.StringIO()):
+            os.environ.pop("OMP_NUM_THREADS", None)
+            return stt.cpu_settings(args, args.sources, args.workers)
+
+    def test_workers_of_one_model_share_the_cores(self):
+        self.assertEqual(self.settings("-w", "4"), (8, None))
+        self.assertEqual(self.settings("-w", "4", "--pin-models"),
+                         (8, {"medium": set(range(8))}))
+
+    def test_cores_divided_between_models(self):
+        other = os.path.join(self.tmpdir.name, "other")
+        threads, pinning = self.settings("-f", other + ",model=small",
+                                         "--pin-models")
+        self.assertEqual(threads, 4)
+        self.assertEqual(pinning, {"medium": {0, 1, 2, 3},
+                                   "small": {4, 5, 6, 7}})
+        self.assertEqual(self.settings("-f", other + ",model=small",
+                                       "-w", "1")[0], 8)
+
+
+class TestPinning(TranscriberTestCase):
+    @unittest.skipUnless(hasattr(os, "sched_setaffinity"), "Linux only")
+    def test_pinned_model_runs_in_its_own_thread(self):
+        AI = self.transciber(TARGETS, [{"text": " kauppa maitoa"}])
+        threads = []
+        transcribe = self.model.transcribe
+        self.model.transcribe = lambda audio, **options: \
+            threads.append(threading.current_thread()) \
+            or transcribe(audio, **options)
+        AI.pin_models({"medium": os.sched_getaffinity(0)})
+        with patch.dict(sys.modules, {"whisper": self.fake_whisper}):
+            self.assertEqual(AI.transcribe("a.wav"), " kauppa maitoa")
+        AI.runners["medium"].shutdown()
+        self.assertNotEqual(threads, [threading.current_thread()])
+
+
+class TestDecodingProfiles(TranscriberTestCase):
+    def test_single_pass_without_profiles(self):
+        AI = self.transciber(TARGETS, [{"text": " kauppa maitoa"}])
+        with patch.dict(sys.modules, {"whisper": self.fake_whisper}):
+            self.assertEqual(AI.transcribe("a.wav"), " kauppa maitoa")
+        self.assertEqual(self.model.calls, [{"fp16": False}])
+
+    def test_full_pass_with_target_profile(self):
+        targets = dict(TARGETS, kauppa=dict(TARGETS["kauppa"],
+                                            profile="fast"))
+        head = {"text": " kauppa maitoa", "segments": [], "language": "fi"}
+        AI = self.transciber(targets, [head, {"text": " kauppa kaikki"}])
+        with patch.dict(sys.modules, {"whisper": self.fake_whisper}):
+            self.assertEqual(AI.transcribe("a.wav"), " kauppa kaikki")
+        self.assertEqual(self.model.calls[0]["clip_timestamps"], "0,30")
+        self.assertEqual(self.model.calls[1],
+                         {"fp16": False, "temperature": 0.0,
+                          "condition_on_previous_text": False})
+
+    def test_continue_with_default_profile(self):
+        targets = dict(TARGETS, kauppa=dict(TARGETS["kauppa"],
+                                            profile="fast"))
+        head = {"text": " muistio yksi kaksi", "language": "fi",
+                "segments": [{"text": " muistio yksi", "end": 20.0},
+                             {"text": " kaksi", "end": 30.0}]}
+        AI = self.transciber(targets, [head, {"text": " kaksi kolme"}])
+        with patch.dict(sys.modules, {"whisper": self.fake_whisper}):
+            self.assertEqual(AI.transcribe("a.wav"),
+                             " muistio yksi kaksi kolme")
+        self.assertEqual(self.model.calls[1]["clip_timestamps"], "20.0")
+        self.assertEqual(self.model.calls[1]["language"], "fi")
+        self.assertEqual(self.model.calls[1]["initial_prompt"], " muistio yksi")
+
+
+class TestFolders(TranscriberTestCase):
+    def test_only_models_in_use_are_loaded(self):
+        loaded = []
+        fake_whisper = types.SimpleNamespace(
+            load_model = lambda size, download_root: loaded.append(size)
+            or FakeModel([]))
+        other = os.path.join(self.tmpdir.name, "other")
+        args = stt.init(["LLM_text_to_speech.py", "-t", self.targets,
+                         "-e", self.email,
+                         "-f", self.audio + ",model=small",
+                         "-f", other + ",model=small"])
+        with patch.dict(sys.modules, {"whisper": fake_whisper}), \
+                redirect_stdout(io.StringIO()):
+            AI = stt.start_transciber(args, args.sources)
+        self.assertEqual(loaded, ["small"])
+        self.assertEqual(list(AI.models), ["small"])
+
+    def test_folder_target_and_model(self):
+        targets = dict(TARGETS, anna={"keepaudiofile": False,
+                                      "transcript": "anna"})
+        AI = self.transciber(targets, [{"text": " kauppa maitoa"}])
+        small = FakeModel([{"text": " muistiinpano"}])
+        AI.models["small"] = (small, threading.Lock())
+        AI.target_location = os.path.join(self.tmpdir.name, "target")
+        for folder in ["inbox", "notes", "anna"]:
+            os.makedirs(os.path.join(AI.target_location, folder))
+        anna = os.path.join(self.tmpdir.name, "anna")
+        os.mkdir(anna)
+        self.write(os.path.join(self.audio, "a.wav"), "1234")
+        self.write(os.path.join(anna, "b.wav"), "1234")
+        queue = stt.scheduler.FairShare([
+            stt.scheduler.Share(stt.inbox.parse_source(self.audio),
+                                stt.inbox.Inbox(self.audio, 0)),
+            stt.scheduler.Share(
+                stt.inbox.parse_source(anna + ",target=anna,model=small"),
+                stt.inbox.Inbox(anna, 0))])
+
+        with patch.dict(sys.modules, {"whisper": self.fake_whisper}), \
+                redirect_stdout(io.StringIO()):
+            handled = [stt.process_next(AI, queue) for _ in range(3)]
+        self.assertEqual(handled, ["a.wav", "b.wav", None])
+        # a magic word wins over the folder target
+        self.assertTrue(os.path.isfile(os.path.join(AI.target_location,
+                                                    "notes", "a.wav.md")))
+        with open(os.path.join(AI.target_location, "anna", "b.wav.md")) as f:
+            self.assertEqual(f.read(), " muistiinpano\n")
+        self.assertEqual(len(self.model.calls), 1)
+        self.assertEqual(len(small.calls), 1)
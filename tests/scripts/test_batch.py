@@ -0,0 +1,66 @@
+import io
+import os
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from batch import Checkpoint, walk_files, run_batch
+
+
+class BatchTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = os.path.join(self.tmpdir.name, "archive")
+        for path in ["2023/01/a.wav", "2023/01/notes.txt", "2023/02/b.mp3",
+                     "c.m4a"]:
+            path = os.path.join(self.folder, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "w") as f:
+                f.write("audio")
+        self.checkpoint_path = os.path.join(self.tmpdir.name, "check.jsonl")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+
+class TestWalkAndCheckpoint(BatchTestCase):
+    def test_walk_files(self):
+        self.assertEqual(walk_files(self.folder),
+                         ["2023/01/a.wav", "2023/02/b.mp3", "c.m4a"])
+
+    def test_checkpoint_survives_restart(self):
+        checkpoint = Checkpoint(self.checkpoint_path)
+        checkpoint.record("a.wav")
+        checkpoint.record("b.wav", "RuntimeError('ffmpeg')")
+        checkpoint.record("c.wav", "RuntimeError('ffmpeg')")
+        checkpoint.record("c.wav")
+        with open(self.checkpoint_path, "a") as f:
+            f.write('{"file": "cut sh')
+        resumed = Checkpoint(self.checkpoint_path)
+        self.assertEqual(resumed.done, {"a.wav", "c.wav"})
+        self.assertEqual(resumed.failed, {"b.wav": "RuntimeError('ffmpeg')"})
+
+
+class TestRunBatch(BatchTestCase):
+    def test_parallel_run_with_failure(self):
+        handled = []
+
+        def process(directory, filename):
+            if filename == "b.mp3":
+                raise RuntimeError("ffmpeg failed")
+            handled.append(os.path.join(directory, filename))
+
+        checkpoint = Checkpoint(self.checkpoint_path)
+        with redirect_stdout(io.StringIO()) as output:
+            summary = run_batch(self.folder, walk_files(self.folder), process,
+                                checkpoint, workers=3)
+        self.assertEqual(summary["handled"], 3)
+        self.assertEqual(summary["failed"], 1)
+        self.assertFalse(summary["interrupted"])
+        self.assertEqual(sorted(handled),
+                         [os.path.join(self.folder, "2023/01/a.wav"),
+                          os.path.join(self.folder, "c.m4a")])
+        self.assertEqual(checkpoint.done, {"2023/01/a.wav", "c.m4a"})
+        self.assertIn("2023/02/b.mp3", checkpoint.failed)
+        self.assertIn("ERROR: 2023/02/b.mp3: ffmpeg failed",
+                      output.getvalue())
+        self.assertIn("[3/3]", output.getvalue())
@@ -0,0 +1,98 @@
+import os
+import tempfile
+import unittest
+import cpu
+
+
+class FakeSysfs(unittest.TestCase):
+    """ 2 NUMA nodes with 4 cores of 2 hyperthreads each. """
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.sysfs = os.path.join(self.tmpdir.name, "cpu")
+        self.cgroup = os.path.join(self.tmpdir.name, "cgroup")
+        os.makedirs(self.cgroup)
+        for number in range(16):
+            # Linux numbers the second hyperthreads of the cores last
+            core = number % 8
+            folder = os.path.join(self.sysfs, f"cpu{number}")
+            os.makedirs(os.path.join(folder, "topology"))
+            os.makedirs(os.path.join(folder, f"node{core // 4}"))
+            self.write(os.path.join(folder, "topology",
+                                    "physical_package_id"), core // 4)
+            self.write(os.path.join(folder, "topology", "core_id"), core % 4)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, path, value):
+        os.makedirs(os.path.dirname(path), exist_ok = True)
+        with open(path, "w") as f:
+            f.write(f"{value}\n")
+
+    def detect(self, cpus = range(16)):
+        return cpu.detect(list(cpus), self.cgroup, self.sysfs)
+
+
+class TestTopology(FakeSysfs):
+    def test_parse_cpulist(self):
+        self.assertEqual(cpu.parse_cpulist("0-3,8,10-11\n"),
+                         [0, 1, 2, 3, 8, 10, 11])
+
+    def test_hyperthreads_are_one_core(self):
+        topology = self.detect()
+        self.assertEqual(len(topology.cores), 8)
+        self.assertEqual(topology.cores[0], cpu.Core(0, 0, 0, (0, 8)))
+        self.assertEqual(topology.cores[4].node, 1)
+        self.assertEqual(cpu.threads_per_inference(topology), 8)
+        self.assertEqual(cpu.describe(topology),
+                         "16 CPUs, 8 cores, 2 NUMA nodes, no quota")
+
+    def test_affinity_mask(self):
+        topology = self.detect([0, 1, 8])
+        self.assertEqual(cpu.threads_per_inference(topology), 2)
+
+    def test_missing_topology(self):
+        topology = cpu.detect([0, 1], self.cgroup,
+                              os.path.join(self.tmpdir.name, "missing"))
+        self.assertEqual(len(topology.cores), 2)
+
+    def test_cgroup_v2_quota(self):
+        self.write(os.path.join(self.cgroup, "cpu.max"), "250000 100000")
+        topology = self.detect()
+        self.assertEqual(topology.quota, 2.5)
+        self.assertEqual(cpu.threads_per_inference(topology), 2)
+        self.assertEqual(cpu.threads_per_inference(topology, 4), 1)
+        self.write(os.path.join(self.cgroup, "cpu.max"), "max 100000")
+        self.assertIsNone(self.detect().quota)
+
+    def test_cgroup_v1_quota(self):
+        self.write(os.path.join(self.cgroup, "cpu,cpuacct",
+                                "cpu.cfs_quota_us"), 400000)
+        self.write(os.path.join(self.cgroup, "cpu,cpuacct",
+                                "cpu.cfs_period_us"), 100000)
+        self.assertEqual(self.detect().quota, 4.0)
+        self.write(os.path.join(self.cgroup, "cpu,cpuacct",
+                                "cpu.cfs_quota_us"), -1)
+        self.assertIsNone(self.detect().quota)
+
+    def test_core_sets_follow_numa_nodes(self):
+        sets = cpu.core_sets(self.detect(), 2)
+        self.assertEqual(sets, [{0, 1, 2, 3, 8, 9, 10, 11},
+                                {4, 5, 6, 7, 12, 13, 14, 15}])
+        self.assertEqual(len(cpu.core_sets(self.detect(), 3)[0]), 4)
+
+    def test_core_sets_within_quota(self):
+        self.write(os.path.join(self.cgroup, "cpu.max"), "200000 100000")
+        self.assertEqual(cpu.core_sets(self.detect(), 2), [{0, 8}, {1, 9}])
+        self.assertEqual(cpu.core_sets(self.detect(), 3),
+                         [{0, 8}, {1, 9}, {0, 8}])
+
+    @unittest.skipUnless(hasattr(os, "sched_setaffinity"), "Linux only")
+    def test_pin_current_thread(self):
+        allowed = os.sched_getaffinity(0)
+        try:
+            cpu.pin_current_thread({min(allowed)})
+            self.assertEqual(os.sched_getaffinity(0), {min(allowed)})
+        finally:
+            os.sched_setaffinity(0, allowed)
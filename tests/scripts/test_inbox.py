@@ -0,0 +1,91 @@
+import os
+import tempfile
+import unittest
+from inbox import (Inbox, Source, parse_source, pending_files,
+                   queue_status)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestInbox(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.clock = FakeClock()
+        self.inbox = Inbox(self.folder, settle_seconds=2, clock=self.clock)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, filename, content, mtime):
+        path = os.path.join(self.folder, filename)
+        with open(path, "a") as f:
+            f.write(content)
+        os.utime(path, (mtime, mtime))
+
+    def ready(self):
+        return [item.filename for item in self.inbox.ready_files()]
+
+    def test_pending_files_oldest_first(self):
+        self.write("b.wav", "x", 2000)
+        self.write("a.WAV", "x", 3000)
+        self.write("c.txt", "x", 1000)
+        self.assertEqual([item.filename for item in pending_files(self.folder)],
+                         ["b.wav", "a.WAV"])
+        self.assertEqual(queue_status(self.folder, now=3100)
+                         ["oldest_age_seconds"], 1100.0)
+
+    def test_file_is_ready_once_it_stops_growing(self):
+        self.write("a.wav", "1234", 1000)
+        self.assertEqual(self.ready(), [])
+        self.assertEqual([item.filename for item in self.inbox.growing_files()],
+                         ["a.wav"])
+        self.clock.now += 1
+        self.write("a.wav", "5678", 1001)
+        self.assertEqual(self.ready(), [])
+        self.clock.now += 1.5
+        self.assertEqual(self.ready(), [])
+        self.clock.now += 0.5
+        self.assertEqual(self.ready(), ["a.wav"])
+        self.assertEqual(self.inbox.growing_files(), [])
+
+    def test_empty_file_is_never_ready(self):
+        self.write("a.wav", "", 1000)
+        self.ready()
+        self.clock.now += 10
+        self.assertEqual(self.ready(), [])
+
+    def test_failed_file_is_skipped_until_it_changes(self):
+        self.write("a.wav", "1234", 1000)
+        self.ready()
+        self.clock.now += 5
+        item = self.inbox.ready_files()[0]
+        self.inbox.failed(item)
+        self.assertEqual(self.ready(), [])
+        self.write("a.wav", "5678", 1001)
+        self.ready()
+        self.clock.now += 5
+        self.assertEqual(self.ready(), ["a.wav"])
+
+
+class TestParseSource(unittest.TestCase):
+    def test_path_only(self):
+        self.assertEqual(parse_source("/audio"),
+                         Source("/audio", "default", None, 1.0))
+
+    def test_options(self):
+        self.assertEqual(parse_source("/audio/anna,target=anna,model=small,"
+                                      "weight=2"),
+                         Source("/audio/anna", "anna", "small", 2.0))
+
+    def test_invalid(self):
+        for spec in ["/audio,colour=red", "/audio,target", "/audio,model=",
+                     "/audio,weight=many", "/audio,weight=0"]:
+            with self.subTest(spec = spec), self.assertRaises(ValueError):
+                parse_source(spec)
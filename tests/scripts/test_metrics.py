@@ -0,0 +1,57 @@
+import unittest
+import urllib.error
+import urllib.request
+from metrics import Counter, Gauge, Histogram, serve, \
+    stage, stage_seconds
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter(self):
+        counter = Counter("test_counter_total", "Test counter")
+        counter.inc(target = "kauppa", outcome = "transcript")
+        counter.inc(2, target = "kauppa", outcome = "transcript")
+        self.assertIn('test_counter_total{outcome="transcript",'
+                      + 'target="kauppa"} 3', counter.render())
+
+    def test_gauge_function(self):
+        gauge = Gauge("test_gauge", "Test gauge")
+        gauge.set(1.5)
+        gauge.set_function(lambda: 7, folder = "/audio")
+        gauge.set_function(lambda: 1 / 0, folder = "/broken")
+        lines = gauge.render()
+        self.assertIn("# TYPE test_gauge gauge", lines)
+        self.assertIn("test_gauge 1.5", lines)
+        self.assertIn('test_gauge{folder="/audio"} 7', lines)
+        self.assertFalse(any("broken" in line for line in lines))
+
+    def test_histogram(self):
+        histogram = Histogram("test_seconds", "Test histogram",
+                              buckets = (0.1, 1))
+        for value in (0.05, 0.5, 5):
+            histogram.observe(value, stage = "x")
+        lines = histogram.render()
+        self.assertIn('test_seconds_bucket{stage="x",le="0.1"} 1', lines)
+        self.assertIn('test_seconds_bucket{stage="x",le="1"} 2', lines)
+        self.assertIn('test_seconds_bucket{stage="x",le="+Inf"} 3', lines)
+        self.assertIn('test_seconds_count{stage="x"} 3', lines)
+        self.assertIn('test_seconds_sum{stage="x"} 5.55', lines)
+
+    def test_stage(self):
+        with stage("unit-test"):
+            pass
+        self.assertIn('stt_stage_seconds_count{stage="unit-test"} 1',
+                      stage_seconds.render())
+
+    def test_endpoint(self):
+        server = serve(0)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}"
+            with urllib.request.urlopen(url + "/metrics") as response:
+                body = response.read().decode()
+            self.assertIn("process_resident_memory_bytes ", body)
+            self.assertEqual(body, body.rstrip("\n") + "\n")
+            with self.assertRaises(urllib.error.HTTPError):
+                urllib.request.urlopen(url + "/other")
+        finally:
+            server.shutdown()
+            server.server_close()
@@ -0,0 +1,42 @@
+import unittest
+from profiles import compile_profiles, builtin_profiles
+
+
+class TestCompileProfiles(unittest.TestCase):
+    def test_builtin_profiles(self):
+        compiled = compile_profiles({})
+        self.assertEqual(compiled, builtin_profiles)
+        self.assertIsNot(compiled["fast"], builtin_profiles["fast"])
+
+    def test_base_and_override(self):
+        compiled = compile_profiles({
+            "fi-fast": {"base": "fast", "language": "fi"},
+            "fast": {"beam_size": 2},
+            "plain": {"language": "en"},
+        })
+        self.assertEqual(compiled["fi-fast"],
+                         {"temperature": 0.0,
+                          "condition_on_previous_text": False,
+                          "beam_size": 2, "language": "fi"})
+        self.assertEqual(compiled["plain"], {"language": "en"})
+
+    def test_null_resets_option(self):
+        compiled = compile_profiles({"greedy": {"base": "accurate",
+                                                "beam_size": None}})
+        self.assertEqual(compiled["greedy"], {"best_of": 5})
+
+    def test_invalid_profiles(self):
+        invalid = [
+            [],
+            {"x": {"unknown_option": 1}},
+            {"x": {"beam_size": "5"}},
+            {"x": {"beam_size": True}},
+            {"x": {"temperature": [0.0, "hot"]}},
+            {"x": {"base": "missing"}},
+            {"x": {"base": "y"}, "y": {"base": "x"}},
+            {"x": {"base": []}},
+        ]
+        for definitions in invalid:
+            with self.subTest(definitions=definitions):
+                with self.assertRaises(ValueError):
+                    compile_profiles(definitions)
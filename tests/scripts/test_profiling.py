@@ -0,0 +1,119 @@
+import json
+import os
+import tempfile
+import threading
+import unittest
+import metrics
+import profiling
+
+
+class TestProfiler(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "profile.jsonl")
+
+    def tearDown(self):
+        profiling.active = None
+        metrics.stage_hooks.clear()
+        self.tmpdir.cleanup()
+
+    def records(self):
+        with open(self.path) as f:
+            return [json.loads(line) for line in f]
+
+    def test_off_by_default(self):
+        with profiling.trace_file("/audio/a.wav"):
+            profiling.annotate(audio_seconds = 3.0)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_record_per_file(self):
+        profiling.start(self.path)
+        for name in ("a.wav", "b.wav"):
+            with profiling.trace_file("/audio/" + name):
+                with metrics.stage("decode"):
+                    pass
+                with metrics.stage("inference"):
+                    pass
+                with metrics.stage("inference"):
+                    pass
+                profiling.annotate(audio_seconds = 10.0, target = "kauppa")
+                profiling.annotate(add = True, windows = 2, fallbacks = 1)
+                profiling.annotate(add = True, windows = 1, fallbacks = 0)
+        records = self.records()
+        self.assertEqual([r["file"] for r in records],
+                         ["/audio/a.wav", "/audio/b.wav"])
+        record = records[0]
+        self.assertEqual(set(record["stages"]), {"decode", "inference"})
+        self.assertEqual(record["windows"], 3)
+        self.assertEqual(record["fallbacks"], 1)
+        self.assertEqual(record["target"], "kauppa")
+        self.assertAlmostEqual(record["rtf"], record["wall_seconds"] / 10.0)
+        self.assertEqual(record["dumps"], [])
+
+    def test_error_is_recorded(self):
+        profiling.start(self.path)
+        with self.assertRaises(RuntimeError):
+            with profiling.trace_file("/audio/a.wav"):
+                raise RuntimeError("ffmpeg failed")
+        self.assertIn("ffmpeg failed", self.records()[0]["error"])
+
+    def test_dump_of_slow_files(self):
+        dumps = os.path.join(self.tmpdir.name, "dumps")
+        profiling.start(self.path, slow_seconds = 0.0, dump_folder = dumps)
+        with profiling.trace_file("/audio/a.wav"):
+            sum(range(1000))
+        record = self.records()[0]
+        self.assertEqual(len(record["dumps"]), 1)
+        self.assertTrue(os.path.isfile(record["dumps"][0]))
+
+    def test_one_file_dumped_at_a_time(self):
+        dumps = os.path.join(self.tmpdir.name, "dumps")
+        profiling.start(self.path, slow_seconds = 0.0, dump_folder = dumps)
+        inside = threading.Event()
+        done = threading.Event()
+
+        def other_worker():
+            with profiling.trace_file("/audio/b.wav"):
+                inside.set()
+                done.wait(5)
+
+        worker = threading.Thread(target = other_worker)
+        worker.start()
+        inside.wait(5)
+        with profiling.trace_file("/audio/a.wav"):
+            pass
+        done.set()
+        worker.join()
+        records = {os.path.basename(record["file"]): record
+                   for record in self.records()}
+        self.assertEqual(records["a.wav"]["dumps"], [])
+        self.assertEqual(len(records["b.wav"]["dumps"]), 1)
+
+    def test_no_dump_of_fast_files(self):
+        profiling.start(self.path, slow_seconds = 60.0)
+        with profiling.trace_file("/audio/a.wav"):
+            pass
+        self.assertEqual(self.records()[0]["dumps"], [])
+
+
+class TestDecodeStats(unittest.TestCase):
+    def test_windows_and_fallbacks(self):
+        result = {"segments": [
+            {"seek": 0, "temperature": 0.0},
+            {"seek": 0, "temperature": 0.0},
+            {"seek": 3000, "temperature": 0.4},
+            {"seek": 6000, "temperature": 0.0},
+        ]}
+        self.assertEqual(profiling.decode_stats(result, {}, 0, 90), (3, 1))
+        self.assertEqual(profiling.decode_stats(
+            result, {"temperature": [0.4, 0.8]}, 0, 90), (3, 0))
+
+    def test_windows_without_segments(self):
+        # 0-25 s speech, 25-55 s skipped as silence, speech again until 70 s
+        result = {"segments": [{"seek": 0, "end": 25.0},
+                               {"seek": 5500, "end": 70.0}]}
+        self.assertEqual(profiling.decode_stats(result, {}, 0, 70), (3, 0))
+        # silence until the end
+        self.assertEqual(profiling.decode_stats(result, {}, 0, 150), (6, 0))
+        self.assertEqual(profiling.decode_stats({"segments": []}, {}, 20, 80),
+                         (2, 0))
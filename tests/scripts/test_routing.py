@@ -0,0 +1,117 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from routing import normalize, RoutingIndex, TargetsFile, ConfigError
+
+CONFIG = {
+    "default": {"keepaudiofile": False, "transcript": "inbox"},
+    "kauppa": {"keepaudiofile": False, "transcript": "notes",
+               "filename": "shopping.md", "aliases": ["shopping list"]},
+    "todo": {"keepaudiofile": False, "transcript": "notes",
+             "filename": "todo.md"},
+    "todo later": {"keepaudiofile": False, "transcript": "notes",
+                   "filename": "later.md"},
+    "juha": {"keepaudiofile": True, "email": "juha@example.com",
+             "transcript": "subject", "fuzzy": False},
+}
+
+
+class TestNormalize(unittest.TestCase):
+    def test_case_diacritics_and_punctuation(self):
+        self.assertEqual(normalize("Äänitä, KIITOS!"), ["aanita", "kiitos"])
+        self.assertEqual(normalize('"To-do." list'), ["todo", "list"])
+        self.assertEqual(normalize(" ... "), [])
+
+
+class TestRoutingIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = RoutingIndex(CONFIG)
+
+    def test_exact_match(self):
+        route = self.index.lookup("Kauppa. Maitoa ja leipää")
+        self.assertEqual(route.target, "kauppa")
+        self.assertFalse(route.fuzzy)
+
+    def test_alias_phrase(self):
+        route = self.index.lookup("Shopping list: milk")
+        self.assertEqual(route.target, "kauppa")
+        self.assertEqual(route.matched, "shopping list")
+
+    def test_longest_phrase_wins(self):
+        self.assertEqual(self.index.lookup("Todo later, call mom").target,
+                         "todo later")
+        self.assertEqual(self.index.lookup("Todo: call mom").target, "todo")
+
+    def test_fuzzy_match(self):
+        route = self.index.lookup("Kaupa, maitoa")
+        self.assertEqual(route.target, "kauppa")
+        self.assertTrue(route.fuzzy)
+
+    def test_fuzzy_disabled_for_target(self):
+        self.assertEqual(self.index.lookup("Juho, call me").target, "default")
+
+    def test_default_and_empty(self):
+        self.assertEqual(self.index.lookup("Something else").target,
+                         "default")
+        self.assertEqual(self.index.lookup("").target, "default")
+        self.assertEqual(self.index.lookup("x", fallback="todo").target,
+                         "todo")
+
+    def test_invalid_configs(self):
+        with self.assertRaises(ConfigError):
+            RoutingIndex({"kauppa": {"transcript": "notes"}})
+        with self.assertRaises(ConfigError):
+            RoutingIndex({"default": {"transcript": "x", "aliases": "y"}})
+        with self.assertRaises(ConfigError):
+            RoutingIndex({"default": {"transcript": "x", "fuzzy": 2}})
+        with self.assertRaises(ConfigError):
+            RoutingIndex({"default": {"transcript": "x", "profile": ["fast"]}})
+        with self.assertRaises(ConfigError):
+            RoutingIndex({"profiles": {"a": {"base": []}},
+                          "default": {"transcript": "x"}})
+
+
+class TestTargetsFile(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "targets.json")
+        self.write(CONFIG, 1000)
+        self.targets = TargetsFile(self.path)
+        self.targets.load()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, content, mtime):
+        with open(self.path, "w") as f:
+            f.write(content if isinstance(content, str)
+                    else json.dumps(content))
+        os.utime(self.path, (mtime, mtime))
+
+    def test_unchanged_file_is_not_reloaded(self):
+        index = self.targets.index
+        self.assertFalse(self.targets.reload_if_changed())
+        self.assertIs(self.targets.index, index)
+
+    @patch('builtins.print')
+    def test_changed_file_is_reloaded(self, mock_print):
+        config = dict(CONFIG, uusi={"transcript": "new"})
+        self.write(config, 2000)
+        self.assertTrue(self.targets.reload_if_changed())
+        self.assertEqual(self.targets.index.lookup("Uusi asia").target,
+                         "uusi")
+
+    @patch('builtins.print')
+    def test_broken_file_keeps_old_index(self, mock_print):
+        index = self.targets.index
+        self.write("{ not json", 2000)
+        self.assertFalse(self.targets.reload_if_changed())
+        self.assertIs(self.targets.index, index)
+        self.assertFalse(self.targets.reload_if_changed())
+        self.assertEqual(mock_print.call_count, 1)
+
+    def test_load_missing_file(self):
+        with self.assertRaises(ConfigError):
+            TargetsFile(os.path.join(self.tmpdir.name, "nope.json")).load()
@@ -0,0 +1,77 @@
+import unittest
+from inbox import PendingFile, Source
+from scheduler import FairShare, Share
+
+
+class FakeBox:
+    """ An inbox.Inbox whose files are all ready. """
+
+    def __init__(self, folder, count):
+        self.files = [PendingFile(folder, f"{i:03d}.wav", 1, i)
+                      for i in range(count)]
+        self.failures = []
+
+    def ready_files(self):
+        return [item for item in self.files if item not in self.failures]
+
+    def growing_files(self):
+        return []
+
+    def failed(self, item):
+        self.failures.append(item)
+
+
+class TestFairShare(unittest.TestCase):
+    def share(self, folder, count, weight = 1.0):
+        return Share(Source(folder, "default", None, weight),
+                     FakeBox(folder, count))
+
+    def handle(self, queue, seconds):
+        """ Handles the next file, returns its folder. """
+        claim = queue.claim()
+        if claim is None:
+            return None
+        claim.share.box.files.remove(claim.item)
+        queue.release(claim, seconds[claim.item.folder])
+        return claim.item.folder
+
+    def test_long_queue_does_not_starve_others(self):
+        noisy, quiet = self.share("noisy", 50), self.share("quiet", 3)
+        queue = FairShare([noisy, quiet])
+        order = [self.handle(queue, {"noisy": 1, "quiet": 1})
+                 for _ in range(8)]
+        self.assertEqual(order[:6], ["noisy", "quiet"] * 3)
+        self.assertEqual(order[6:], ["noisy", "noisy"])
+
+    def test_worker_time_follows_weights(self):
+        queue = FairShare([self.share("a", 100, weight = 2),
+                           self.share("b", 100)])
+        seconds = {"a": 1, "b": 1}
+        order = [self.handle(queue, seconds) for _ in range(30)]
+        self.assertEqual(order.count("a"), 20)
+
+    def test_slow_files_use_up_the_share(self):
+        queue = FairShare([self.share("slow", 100), self.share("fast", 100)])
+        seconds = {"slow": 10, "fast": 1}
+        order = [self.handle(queue, seconds) for _ in range(40)]
+        # the slow folder gets about as much worker time as the fast one
+        self.assertLess(abs(order.count("slow") * 10
+                            - order.count("fast")), 15)
+
+    def test_idle_folder_does_not_save_up_time(self):
+        busy, idle = self.share("busy", 100), self.share("idle", 0)
+        queue = FairShare([busy, idle])
+        for _ in range(20):
+            self.handle(queue, {"busy": 1})
+        idle.box.files = FakeBox("idle", 5).files
+        order = [self.handle(queue, {"busy": 1, "idle": 1})
+                 for _ in range(6)]
+        self.assertEqual(order.count("idle"), 3)
+
+    def test_claimed_files_are_not_handed_out_twice(self):
+        queue = FairShare([self.share("a", 2)])
+        first, second = queue.claim(), queue.claim()
+        self.assertNotEqual(first.item, second.item)
+        self.assertIsNone(queue.claim())
+        queue.release(first, 1, failed = True)
+        self.assertEqual(first.share.box.failures, [first.item])
@@ -0,0 +1,136 @@
+import os
+import struct
+import tempfile
+import unittest
+import wave
+from tail import WavReader, WavError, TailState, TailTranscriptions
+
+
+class FakeAI:
+    """ Transcribes a window into one word per started 10 seconds. """
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe_window(self, audio, prompt=None, language=None,
+                          model_size=None):
+        self.calls.append((audio, prompt, language, model_size))
+        seconds = audio / 8000
+        segments = [{"text": f" w{len(self.calls)}.{i}", "end": min(end, seconds)}
+                    for i, end in enumerate(range(10, int(seconds) + 10, 10))]
+        return {"text": "".join(s["text"] for s in segments),
+                "segments": segments, "language": "fi"}
+
+
+class TailTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "upload.wav")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_wav(self, seconds, rate=8000, truncate_to=None):
+        with wave.open(self.path, "wb") as w:
+            w.setnchannels(1)
+            w.setsampwidth(2)
+            w.setframerate(rate)
+            w.writeframes(b"\x01\x00" * int(seconds * rate))
+        if truncate_to is not None:
+            with open(self.path, "r+b") as f:
+                f.truncate(44 + truncate_to * rate * 2)
+
+
+class TestWavReader(TailTestCase):
+    def test_growing_file(self):
+        # the header claims 90 s, only 45 s has arrived
+        self.write_wav(90, truncate_to=45)
+        reader = WavReader(self.path)
+        self.assertEqual(reader.duration(), 45)
+        self.assertEqual(len(reader.read(30, 40)), 10 * 8000 * 2)
+        self.assertEqual(len(reader.read(40)), 5 * 8000 * 2)
+
+    def test_chunk_after_the_samples(self):
+        self.write_wav(10)
+        with open(self.path, "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            f.write(b"LIST" + struct.pack("<I", 200000) + b"\x07" * 200000)
+        reader = WavReader(self.path)
+        self.assertEqual(reader.duration(), 10)
+        self.assertEqual(len(reader.read(5)), 5 * 8000 * 2)
+        self.assertNotIn(b"\x07", reader.read(0))
+
+    def test_placeholder_data_size(self):
+        self.write_wav(20)
+        with open(self.path, "r+b") as f:
+            f.seek(40)
+            f.write(struct.pack("<I", 0xFFFFFFFF))
+        self.assertEqual(WavReader(self.path).duration(), 20)
+
+    def test_header_not_complete(self):
+        with open(self.path, "wb") as f:
+            f.write(b"RIFF\x00\x00\x00\x00WAVE")
+        with self.assertRaises(WavError):
+            WavReader(self.path)
+
+    def test_not_a_wav(self):
+        with open(self.path, "wb") as f:
+            f.write(b"ID3" + b"\x00" * 100)
+        with self.assertRaises(WavError):
+            WavReader(self.path)
+
+
+class TestTailState(TailTestCase):
+    def setUp(self):
+        super().setUp()
+        # raw byte count stands in for the samples, 8000 bytes a second
+        self.samples = WavReader.samples
+        WavReader.samples = lambda reader, start, end=None: \
+            len(reader.read(start, end)) // 2
+        self.AI = FakeAI()
+
+    def tearDown(self):
+        WavReader.samples = self.samples
+        super().tearDown()
+
+    def test_windows_while_growing_then_finish(self):
+        self.write_wav(90, truncate_to=25)
+        state = TailState(self.path)
+        self.assertFalse(state.advance(self.AI))
+        self.write_wav(90, truncate_to=65)
+        self.assertTrue(state.advance(self.AI))
+        # the segment ending at 30 s may be cut, next window starts at 20 s
+        self.assertEqual(state.offset, 20)
+        self.assertTrue(state.advance(self.AI))
+        self.assertEqual(state.offset, 40)
+        self.assertFalse(state.advance(self.AI))
+        self.write_wav(72)
+        self.assertEqual(state.finish(self.AI),
+                         " w1.0 w1.1 w2.0 w2.1 w3.0 w3.1 w3.2 w3.3")
+        self.assertEqual(self.AI.calls[1][1], " w1.0 w1.1")
+        self.assertEqual(self.AI.calls[2][2], "fi")
+
+    def test_transcriptions(self):
+        tails = TailTranscriptions({self.tmpdir.name: "small"})
+        item = type("Item", (), {"folder": self.tmpdir.name,
+                                 "filename": "upload.wav"})
+        self.write_wav(90, truncate_to=10)
+        self.assertFalse(tails.advance(self.AI, [item]))
+        self.assertIsNone(tails.finish(self.AI, self.path))
+        self.write_wav(90, truncate_to=40)
+        self.assertTrue(tails.advance(self.AI, [item]))
+        self.assertEqual(self.AI.calls[0][3], "small")
+        self.write_wav(40)
+        self.assertEqual(tails.finish(self.AI, self.path),
+                         " w1.0 w1.1 w2.0 w2.1")
+
+    def test_file_disappears(self):
+        tails = TailTranscriptions()
+        item = type("Item", (), {"folder": self.tmpdir.name,
+                                 "filename": "upload.wav"})
+        self.write_wav(90, truncate_to=40)
+        self.assertTrue(tails.advance(self.AI, [item]))
+        # removed while the listing still has it
+        os.remove(self.path)
+        self.assertFalse(tails.advance(self.AI, [item]))
+        self.assertIsNone(tails.finish(self.AI, self.path))